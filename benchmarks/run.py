@@ -0,0 +1,206 @@
+"""Micro-benchmarks for the sync hot paths, against an in-memory influx (see fake_influx.py).
+
+    python -m benchmarks.run                  # everything
+    python -m benchmarks.run write_candles    # only benchmarks with that in their name
+    python -m benchmarks.run --rows 100000 --json results.json
+
+Each benchmark is timed over --repeat runs on fresh synthetic input, and the best run is reported as rows/sec.
+Allocations are measured on a separate run with tracemalloc: peak is the most memory held at once during the call,
+and blocks is the number of allocations still alive when it returned (i.e. what the result holds on to).
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+from loguru import logger
+
+from benchmarks.fake_influx import FakeInfluxDBClient
+from candles.candles import Candles
+from candles.sync_candles import BaseSyncCandles, SyncBinanceCandles, SyncSFOXCandles
+import candles.candles
+
+candles.candles.InfluxDBClient = FakeInfluxDBClient  # looked up when each Candles is created
+
+START = 1590889920  # s
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Registers func(rows) -> (setup, run): setup() builds fresh input, run(input) is what's timed"""
+    BENCHMARKS.append(func)
+    return func
+
+
+def sync_client(cls, data_type="candles"):
+    """A sync instance writing to a FakeInfluxDBClient, without an exchange client"""
+    os.environ.pop("CANDLES_SYNC_STATE_DB", None)
+    bench_cls = type(f"Bench{cls.__name__}", (cls,), {"api_client": lambda self: None})
+    return bench_cls("BTCUSDT", "1m", start=START, end=START + 60 * 1000, data_type=data_type)
+
+
+def candle_series(rows):
+    """Canned influx response with `rows` 1m candles"""
+    values = [
+        [(START + i * 60) * 1_000, 9500.0 + i % 7, 9510.5 + i % 7, 9490.0 + i % 7, 9505.0 + i % 7, 1.5 + i % 3]
+        for i in range(rows)
+    ]
+    return [{"name": "candles_1m", "columns": ["time", "open", "high", "low", "close", "volume"], "values": values}]
+
+
+@benchmark
+def write_candles_list_rows(rows):
+    """Binance klines: lists, prices as strings"""
+    client = sync_client(SyncBinanceCandles)
+
+    def setup():
+        client._last_written = None  # a fresh sync, or the previous repeat's rows would be skipped as unchanged
+        return [
+            [(START + i * 60) * 1_000, "9500.1", "9510.5", "9490.0", "9505.2", "1.53", 0, "0", 10, "0", "0", "0"]
+            for i in range(rows)
+        ]
+
+    return setup, client.write_candles
+
+
+@benchmark
+def write_candles_dict_rows(rows):
+    """SFOX candlesticks: dicts, s timestamps"""
+    client = sync_client(SyncSFOXCandles)
+
+    def setup():
+        client._last_written = None
+        return [
+            {
+                "start_time": START + i * 60,
+                "open_price": "9500.1",
+                "high_price": "9510.5",
+                "low_price": "9490.0",
+                "close_price": "9505.2",
+                "volume": "1.53",
+            }
+            for i in range(rows)
+        ]
+
+    return setup, lambda candles: client.write_candles(candles, timestamp_units="s")
+
+
+@benchmark
+def write_candles_futures(rows):
+    """FTX style futures stats: dicts, string values become tags"""
+    client = sync_client(SyncBinanceCandles, data_type="futures")
+
+    def setup():
+        return [
+            {
+                "time": (START + i * 3600) * 1_000,
+                "name": "BTC-PERP",
+                "underlying": "BTC",
+                "openInterest": 1234.5 + i,
+                "volume": 98765.4,
+                "nextFundingRate": 0.0001,
+                "nextFundingTime": "2020-06-01T00:00:00+00:00",
+                "expired": False,
+            }
+            for i in range(rows)
+        ]
+
+    return setup, client.write_candles
+
+
+@benchmark
+def timestamp_ranges(rows):
+    """Steps for `rows` windows"""
+    return lambda: rows, lambda steps: list(BaseSyncCandles.timestamp_ranges(START, START + steps * 60_000, steps))
+
+
+@benchmark
+def get_iterations_for_range(rows):
+    """Sync planning, with `rows` candles already in the db"""
+    client = sync_client(SyncBinanceCandles)
+    client.influx_client.client.series = candle_series(rows)
+    client.start, client.end = START - 86_400 * 365, START + 86_400 * 365
+    return lambda: client, lambda client: client.get_iterations_for_range(client.API_MAX_RECORDS)
+
+
+@benchmark
+def candles_get(rows):
+    """Candles.get('*') result parsing"""
+    db = Candles("binance", "BTCUSDT", "1m")
+    db.client.series = candle_series(rows)
+    return lambda: db, lambda db: db.get("*", start=START, end=START + rows * 60)
+
+
+@benchmark
+def candles_get_batch(rows):
+    """Candles.get_batch() result parsing, to compare with candles_get"""
+    db = Candles("binance", "BTCUSDT", "1m")
+    db.client.series = candle_series(rows)
+    return lambda: db, lambda db: db.get_batch(start=START, end=START + rows * 60)
+
+
+@benchmark
+def candles_get_lowhigh_windows(rows):
+    """Candles.get_lowhigh_windows() result parsing, `rows` windows"""
+    db = Candles("binance", "BTCUSDT", "1m")
+    db.client.series = candle_series(rows)
+    return lambda: db, lambda db: db.get_lowhigh_windows("1m", start=START, end=START + rows * 60)
+
+
+def measure(func, rows, repeat):
+    setup, run = func(rows)
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup()
+        started = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - started)
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    return {
+        "name": func.__name__,
+        "rows": rows,
+        "seconds": best,
+        "rows_per_sec": rows / best if best else float("inf"),
+        "peak_kib": peak / 1024,
+        "blocks": blocks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("filter", nargs="?", default="", help="only run benchmarks with this in their name")
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per benchmark (default 10000)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, best is reported")
+    parser.add_argument("--json", help="also write the results to this file, to compare runs")
+    args = parser.parse_args()
+
+    logger.remove()  # debug logging would dominate the timings
+    results = []
+    print(f"{'benchmark':<28} {'rows':>8} {'ms':>10} {'rows/sec':>12} {'peak KiB':>10} {'blocks':>8}")
+    for func in BENCHMARKS:
+        if args.filter not in func.__name__:
+            continue
+        res = measure(func, args.rows, args.repeat)
+        results.append(res)
+        print(
+            f"{res['name']:<28} {res['rows']:>8} {res['seconds'] * 1_000:>10.2f} {res['rows_per_sec']:>12,.0f} "
+            f"{res['peak_kib']:>10,.0f} {res['blocks']:>8}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from array import array
+from math import nan
+from operator import ge, itemgetter, le
+
+try:
+    import numpy
+except ImportError:  # optional, only needed for CandleBatch.to_numpy()
+    numpy = None
+
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+
+
+class CandleBatch(object):
+    """Columnar batch of candles: one typed array per column, timestamps always in ms.
+
+    Exchange responses get converted once (see BaseSyncCandles.to_candle_batch), so validating and writing work on
+    whole columns instead of re-inspecting every row. Query results can be read into one too (see
+    Candles.get_batch), which takes ~48 bytes per candle rather than a dict per point, and converts to numpy cheaply.
+    """
+
+    __slots__ = COLUMNS
+
+    def __init__(self, ts=(), open=(), high=(), low=(), close=(), volume=()):
+        self.ts = array("q", ts)
+        self.open = array("d", open)
+        self.high = array("d", high)
+        self.low = array("d", low)
+        self.close = array("d", close)
+        self.volume = array("d", volume)
+
+    @classmethod
+    def from_rows(cls, rows, columns, timestamp_units="ms"):
+        """Builds a batch from exchange rows, which can be lists or dicts.
+        columns maps each of COLUMNS to the row index/key holding it, i.e. candle_order or candle_dict_keys.
+        """
+        if not rows:
+            return cls()
+        ts, _open, high, low, close, volume = zip(*map(itemgetter(*[columns[c] for c in COLUMNS]), rows))
+        ts = map(int, ts)
+        if timestamp_units == "s":  # write in ms, as that's how we query
+            ts = (t * 1_000 for t in ts)
+        return cls(ts, map(float, _open), map(float, high), map(float, low), map(float, close), map(float, volume))
+
+    @classmethod
+    def from_influx(cls, res):
+        """Builds a batch from an influx ResultSet with time, open, high, low, close and volume columns, straight
+        from the response's value lists (without a dict per point, as get_points() makes). Missing values are NaN.
+        """
+        batch = cls()
+        for series in res.raw.get("series", []):
+            columns, values = series["columns"], series["values"]
+            for name in COLUMNS:
+                column = getattr(batch, name)
+                getter = itemgetter(columns.index("time" if name == "ts" else name))
+                try:
+                    column.extend(array(column.typecode, map(getter, values)))
+                except TypeError:  # there are nulls
+                    column.extend(array(column.typecode, (nan if v is None else v for v in map(getter, values))))
+        return batch
+
+    def to_numpy(self):
+        """Returns the candles as a numpy structured array, with an int64 ts and float64 OHLCV fields"""
+        if numpy is None:
+            raise ImportError("CandleBatch.to_numpy() needs numpy installed")
+        out = numpy.empty(len(self), dtype=[("ts", "i8")] + [(c, "f8") for c in COLUMNS[1:]])
+        if len(self):
+            for c in COLUMNS:
+                out[c] = numpy.frombuffer(getattr(self, c), dtype=out.dtype[c])
+        return out
+
+    def __len__(self):
+        return len(self.ts)
+
+    def row(self, i):
+        """Returns candle i as a (ts, open, high, low, close, volume) tuple"""
+        return tuple(getattr(self, c)[i] for c in COLUMNS)
+
+    def rows(self):
+        """Iterates over (ts, open, high, low, close, volume) tuples"""
+        return zip(self.ts, self.open, self.high, self.low, self.close, self.volume)
+
+    def invalid_rows(self):
+        """Returns [(index, reason)] for candles that fail the OHLC sanity checks. The common all-valid case is
+        checked column-wise, without a Python loop per candle.
+        """
+        checks = (
+            (le, self.low, self.high, "Low price must be <= the High price."),
+            (le, self.low, self.close, "Low price must be <= the Close price."),
+            (ge, self.high, self.open, "High price must be >= the Open price."),
+        )
+        bad = []
+        for op, left, right, reason in checks:
+            if all(map(op, left, right)):
+                continue
+            bad.extend((i, reason) for i, ok in enumerate(map(op, left, right)) if not ok)
+        return sorted(bad, key=itemgetter(0))
+
+    def drop(self, indices):
+        """Returns a new batch without the candles at indices"""
+        indices = set(indices)
+        keep = [i for i in range(len(self)) if i not in indices]
+        return CandleBatch(*([getattr(self, c)[i] for i in keep] for c in COLUMNS))
+
+    def validate(self):
+        """Raises AssertionError for the first candle that fails the OHLC sanity checks"""
+        for i, reason in self.invalid_rows():
+            raise AssertionError(f"{reason} Candle: {self.row(i)}")
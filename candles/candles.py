@@ -1,12 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal as D
+import gzip
 import os
+import re
 import sys
+import time
 
 from influxdb import InfluxDBClient
 from loguru import logger
 import arrow
 
+from candles.batch import CandleBatch
+from candles.query_cache import get_query_cache
+
 IS_PYTEST = "pytest" in sys.modules
+LOWHIGH = "MIN(low) AS low, MAX(high) AS high"  # aggregated by influx, rather than sending every candle over
+
+
+def _to_ms(ts):
+    """Any start/end Candles accepts, to ms (None if unset)"""
+    return int(arrow.get(ts).float_timestamp * 1000) if ts else None
 
 
 class Candles(object):
@@ -22,12 +35,17 @@ class Candles(object):
     """
 
     INFLUX_TIMEOUT = 60
+    WRITE_BATCH_SIZE = int(os.getenv("CANDLES_DB_WRITE_BATCH_SIZE", 5_000))  # lines per write request
+    GZIP_LEVEL = 5  # compression is cheap at this level, and line protocol compresses ~10x
+    ITER_CHUNK_CANDLES = 10_000  # candles per iter_range() query, unless given a chunk
+    MAX_QUERY_STATEMENTS = 100  # ranges per get_lowhigh_ranges() request, they're sent in the url
 
     def __init__(self, exchange, symbol, interval, create_if_missing=False, host=None, data_type="candles"):
         self.exchange = exchange.lower()
         self.symbol = symbol
         self.interval = interval
         self.data_type = data_type
+        self.gzip = os.getenv("CANDLES_DB_GZIP", "").lower() in ("1", "true", "yes")
         if host:
             self.client = InfluxDBClient(
                 host=host,
@@ -55,10 +73,96 @@ class Candles(object):
                 self.client.create_database(exchange)
                 self.client.create_database(db)
 
+        self.db = db
         self.client.switch_database(db)
 
-    def write_points(self, *args, **kwargs):
-        return self.client.write_points(time_precision="ms", *args, **kwargs)
+    def write_points(self, points, *args, **kwargs):
+        try:
+            return self.client.write_points(points, *args, time_precision="ms", **kwargs)
+        finally:
+            self._invalidate_points(points, kwargs.get("measurement"), kwargs.get("tags"))
+
+    def write_lines(self, lines, batch_size=None):
+        """Writes pre-encoded line protocol (see candles.line_protocol), with ms timestamps.
+        Sent batch_size (default WRITE_BATCH_SIZE) lines per request, gzipped if CANDLES_DB_GZIP is set.
+        """
+        batch_size = batch_size or self.WRITE_BATCH_SIZE
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.gzip:
+            headers["Content-Encoding"] = "gzip"
+        try:
+            for i in range(0, len(lines), batch_size):
+                data = ("\n".join(lines[i : i + batch_size]) + "\n").encode("utf-8")
+                if self.gzip:
+                    data = gzip.compress(data, compresslevel=self.GZIP_LEVEL)
+                self.client.request(
+                    url="write",
+                    method="POST",
+                    params={"db": self.db, "precision": "ms"},
+                    data=data,
+                    expected_response_code=204,
+                    headers=headers,
+                )
+        finally:
+            self._invalidate_lines(lines)
+        return True
+
+    def _invalidate_points(self, points, measurement=None, tags=None):
+        """Drops the cached query results overlapping write_points() points (see candles.query_cache)"""
+        cache = get_query_cache()
+        if cache is None:
+            return
+        ranges = {}
+        for point in points:
+            symbol = point.get("tags", {}).get("symbol") or (tags or {}).get("symbol")
+            ts = point.get("time")
+            if ts is None:
+                ts = int(time.time() * 1000)  # influx stamps it on arrival
+            elif not isinstance(ts, int):
+                ts = int(arrow.get(ts).float_timestamp * 1000)
+            self._extend_range(ranges, (self.db, point.get("measurement", measurement), symbol), ts)
+        for series, (start, end) in ranges.items():
+            cache.invalidate(series, start, end)
+
+    def _invalidate_lines(self, lines):
+        """Drops the cached query results overlapping write_lines() lines (see candles.query_cache)"""
+        cache = get_query_cache()
+        if cache is None:
+            return
+        ranges = {}
+        for line in lines:
+            ts = line.rpartition(" ")[2]
+            self._extend_range(ranges, line.partition(" ")[0], int(ts) if ts.isdigit() else int(time.time() * 1000))
+        for key, (start, end) in ranges.items():
+            measurement, *tags = key.split(",")
+            symbol = next((tag[7:] for tag in tags if tag.startswith("symbol=")), None)
+            cache.invalidate((self.db, measurement, symbol), start, end)
+
+    @staticmethod
+    def _extend_range(ranges, series, ts):
+        if series in ranges:
+            start, end = ranges[series]
+            ranges[series] = (min(start, ts), max(end, ts))
+        else:
+            ranges[series] = (ts, ts)
+
+    def _cached(self, query, start, end, compute):
+        """Returns compute(), the result of query over start->end, through the query cache if it's enabled (see
+        candles.query_cache). Cached results are shared between hits, so don't modify them.
+        """
+        cache = get_query_cache()
+        if cache is None:
+            return compute()
+        start, end = _to_ms(start), _to_ms(end)
+        series = (self.db, f"{self.data_type}_{self.interval}", self.symbol)
+        key = series + (query, start, end)
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        generation = cache.generation(series)
+        value = compute()
+        cache.put(key, value, series, start, end, generation)
+        return value
 
     def query(self, *args, **kwargs):
         """Wrapper for queries.
@@ -68,24 +172,25 @@ class Candles(object):
         return self.client.query(epoch="ms", *args, **kwargs)
         # return self.client.query(*args, **kwargs)
 
-    def _time_parser(self, params={}, start=None, end=None):
+    def _time_parser(self, params={}, start=None, end=None, suffix=""):
         """Returns (params, query) to use in influx call.
         The query is just the portion where time comparison is happening, so you need to append it
-        to your query.
+        to your query. suffix is appended to the param names, to have several time ranges in one query.
         """
+        start_param, end_param = f"start{suffix}", f"end{suffix}"
         if start and not end:
             start = arrow.get(start).float_timestamp * 1e9
-            params.update({"start": start})
-            return params, "time > $start"
+            params.update({start_param: start})
+            return params, f"time > ${start_param}"
         if end and not start:
             end = arrow.get(end).float_timestamp * 1e9
-            params.update({"end": end})
-            return params, "time < $end"
+            params.update({end_param: end})
+            return params, f"time < ${end_param}"
         elif start and end:
             start = arrow.get(start).float_timestamp * 1e9
             end = arrow.get(end).float_timestamp * 1e9
-            params.update({"start": start, "end": end})
-            return params, "time > $start AND time < $end"
+            params.update({start_param: start, end_param: end})
+            return params, f"time > ${start_param} AND time < ${end_param}"
         else:
             return params, ""
 
@@ -97,59 +202,201 @@ class Candles(object):
         from candles.sync_candles import get_sync_candles_class
 
         query = f"SELECT {query} FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
-        params = {"symbol": self.symbol}
 
         if fetch_latest:
             client = get_sync_candles_class(exchange=self.exchange, symbol=self.symbol, interval=self.interval)
             client.pull_data()
 
-        if start or end:
-            q_where = query + " AND "
-        else:
-            q_where = query
+        def compute():
+            params = {"symbol": self.symbol}
+            if start or end:
+                q_where = query + " AND "
+            else:
+                q_where = query
+
+            params, time_q = self._time_parser(params, start, end)
+            res = self.query(q_where + time_q, bind_params=params)
+            res = list(res.get_points())
+            if not res:
+                return None
+            return res
+
+        return self._cached(query, start, end, compute)
+
+    def get_batch(self, start=None, end=None):
+        """Returns the candles in the provided date range as a CandleBatch, one typed array per column rather than
+        a dict per candle as get() returns, for long histories. See CandleBatch.to_numpy() for a numpy array.
+        """
+        query = f"SELECT open, high, low, close, volume FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
+
+        def compute():
+            params, time_q = self._time_parser({"symbol": self.symbol}, start, end)
+            res = self.query(f"{query} AND {time_q}" if time_q else query, bind_params=params)
+            return CandleBatch.from_influx(res)
+
+        return self._cached(query, start, end, compute)
+
+    def iter_range(self, start, end=None, chunk=None, query="*", batches=False):
+        """Yields the candles from start to end (default now), like get() returns them, querying chunk seconds
+        (default ITER_CHUNK_CANDLES candles) at a time so memory stays flat however long the range is. The next chunk
+        is queried in the background while the current one is being consumed.
+        With batches=True, yields a CandleBatch per chunk instead (see get_batch()), and query is ignored.
+        """
+        from candles.resample import interval_to_seconds
+
+        start, end = _to_ms(start), _to_ms(end) or int(time.time() * 1000)
+        chunk = int(chunk * 1000) if chunk else self.ITER_CHUNK_CANDLES * interval_to_seconds(self.interval) * 1000
+        fields = "open, high, low, close, volume" if batches else query
+        query = (
+            f"SELECT {fields} FROM {self.data_type}_{self.interval} WHERE symbol=$symbol "
+            "AND time >= $start AND time < $end"  # half open, so every candle is in exactly one chunk
+        )
 
-        params, time_q = self._time_parser(params, start, end)
-        res = self.query(q_where + time_q, bind_params=params)
-        res = list(res.get_points())
-        if not res:
-            return None
-        return res
+        def fetch(chunk_start):
+            params = {
+                "symbol": self.symbol,
+                "start": chunk_start * 1_000_000,
+                "end": min(chunk_start + chunk, end) * 1_000_000,
+            }
+            res = self.query(query, bind_params=params)
+            return CandleBatch.from_influx(res) if batches else list(res.get_points())
+
+        chunk_starts = range(start, end, chunk)
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iter_range")
+        future = executor.submit(fetch, chunk_starts[0]) if chunk_starts else None
+        try:
+            for i in range(len(chunk_starts)):
+                res = future.result()
+                future = executor.submit(fetch, chunk_starts[i + 1]) if i + 1 < len(chunk_starts) else None
+                if batches:
+                    if len(res):
+                        yield res
+                else:
+                    yield from res
+        finally:  # i.e. the caller stopped early
+            if future:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def get_lowhigh(self, start=None, end=None):
         """Returns (low, high) for all candles in the provided date range"""
         # date comparison queries in influx must be sent in nanos:
-        query = f"SELECT low, high FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
-        params = {"symbol": self.symbol}
-        if start or end:
-            q_where = query + " AND "
-        else:
-            q_where = query
+        query = f"SELECT {LOWHIGH} FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
+
+        def compute():
+            params = {"symbol": self.symbol}
+            if start or end:
+                q_where = query + " AND "
+            else:
+                q_where = query
+
+            params, time_q = self._time_parser(params, start, end)
+            res = self.query(q_where + time_q, bind_params=params)
+            return self._lowhigh(next(res.get_points(), None))
+
+        return self._cached(query, start, end, compute)
+
+    def get_lowhigh_windows(self, every, start=None, end=None):
+        """Returns [(time, low, high)] for every `every` (an influx duration, i.e. 1h or 1d) in the provided date
+        range, oldest first. time is the start of the window (ms), and windows without candles are left out.
+        """
+        query = f"SELECT {LOWHIGH} FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
+
+        def compute():
+            params, time_q = self._time_parser({"symbol": self.symbol}, start, end)
+            res = self.query(
+                f"{query}{' AND ' if time_q else ''}{time_q} GROUP BY time({every}) fill(none)", bind_params=params
+            )
+            return [(x["time"], D(x["low"]), D(x["high"])) for x in res.get_points()]
+
+        return self._cached(f"{query} GROUP BY time({every})", start, end, compute)
+
+    def get_lowhigh_ranges(self, ranges):
+        """Returns [(low, high)] for each (start, end) in ranges, like get_lowhigh() would, but in as few round trips
+        as possible (one per MAX_QUERY_STATEMENTS ranges).
+        """
+        ranges = list(ranges)
+        query = f"SELECT {LOWHIGH} FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+        # cached as one entry spanning all the ranges, so a write to any of them drops it
+        first = min(starts, key=_to_ms) if ranges and all(starts) else None
+        last = max(ends, key=_to_ms) if ranges and all(ends) else None
+
+        def compute():
+            results = []
+            for i in range(0, len(ranges), self.MAX_QUERY_STATEMENTS):
+                params, statements = {"symbol": self.symbol}, []
+                for n, (start, end) in enumerate(ranges[i : i + self.MAX_QUERY_STATEMENTS]):
+                    params, time_q = self._time_parser(params, start, end, suffix=n)
+                    statements.append(f"{query} AND {time_q}" if time_q else query)
+                res = self.query(";".join(statements), bind_params=params, method="POST")
+                results.extend(
+                    self._lowhigh(next(r.get_points(), None)) for r in (res if isinstance(res, list) else [res])
+                )
+            return results
 
-        params, time_q = self._time_parser(params, start, end)
-        res = self.query(q_where + time_q, bind_params=params)
+        key = f"{query} {[(_to_ms(start), _to_ms(end)) for start, end in ranges]}"
+        return self._cached(key, first, last, compute)
 
-        res = list(res.get_points())
-        if not res:
+    @staticmethod
+    def _lowhigh(point):
+        """(low, high) from a LOWHIGH query's point, None if there were no candles"""
+        if point is None or point["low"] is None:
             return None, None
+        return D(point["low"]), D(point["high"])
+
+    def get_many(self, symbols, query="*", start=None, end=None):
+        """Like get(), for several symbols in one query. Returns {symbol: [points] or None}.
+        This and the other *_many() methods only use the instance's exchange and interval, not its symbol.
+        """
+        params, time_q = self._time_parser({}, start, end)
+        res = self.query(self._many_query(query, symbols, time_q), bind_params=params)
+        return self._by_symbol(res, symbols, list, None)
+
+    def get_latest_many(self, symbols):
+        """Returns {symbol: latest candle or None} for several symbols, in one query"""
+        res = self.query(self._many_query("*", symbols, "", "ORDER BY time DESC LIMIT 1"))
+        return self._by_symbol(res, symbols, next, None)
 
-        lowest = D(min([x["low"] for x in res]))
-        highest = D(max([x["high"] for x in res]))
-        return lowest, highest
+    def get_lowhigh_many(self, symbols, start=None, end=None):
+        """Like get_lowhigh(), for several symbols in one query. Returns {symbol: (low, high)}."""
+        params, time_q = self._time_parser({}, start, end)
+        res = self.query(self._many_query(LOWHIGH, symbols, time_q), bind_params=params)
+        return self._by_symbol(res, symbols, lambda points: self._lowhigh(next(points, None)), (None, None))
+
+    def _many_query(self, fields, symbols, time_q, suffix=""):
+        # influx turns an anchored alternation like this into a lookup of each symbol, rather than a regex scan
+        pattern = "|".join(re.escape(symbol).replace("/", r"\/") for symbol in symbols)
+        where = f"symbol =~ /^({pattern})$/" + (f" AND {time_q}" if time_q else "")
+        return f"SELECT {fields} FROM {self.data_type}_{self.interval} WHERE {where} GROUP BY symbol {suffix}".strip()
+
+    @staticmethod
+    def _by_symbol(res, symbols, parse, default):
+        """Maps each symbol to parse(its points), or default if it had none"""
+        out = dict.fromkeys(symbols, default)
+        for (_, tags), points in res.items():
+            out[tags["symbol"]] = parse(points)
+        return out
 
     def get_percentile(self, field, percentile, start=None, end=None):
         """Returns $percentile of the $field price for all candles in the provided date range"""
-        params = {"symbol": self.symbol}
         query = f"SELECT PERCENTILE({field}, {percentile}) FROM {self.data_type}_{self.interval} WHERE symbol=$symbol"
-        if start or end:
-            q_where = query + " AND "
-        else:
-            q_where = query
 
-        params, time_q = self._time_parser(params, start, end)
-        res = self.query(q_where + time_q, bind_params=params)
+        def compute():
+            params = {"symbol": self.symbol}
+            if start or end:
+                q_where = query + " AND "
+            else:
+                q_where = query
+
+            params, time_q = self._time_parser(params, start, end)
+            res = self.query(q_where + time_q, bind_params=params)
+
+            res = list(res.get_points())
+            if not res:
+                return None
 
-        res = list(res.get_points())
-        if not res:
-            return None
+            return res[0]["percentile"]  # it only returns one result, the percentile calculation result
 
-        return res[0]["percentile"]  # it only returns one result, the percentile calculation result
+        return self._cached(query, start, end, compute)
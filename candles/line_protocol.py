@@ -0,0 +1,57 @@
+"""Encodes points straight to InfluxDB line protocol, skipping the dict-per-point that write_points() needs.
+https://docs.influxdata.com/influxdb/v1.8/write_protocols/line_protocol_reference/
+"""
+
+import math
+
+_TAG_ESCAPES = str.maketrans({"\\": "\\\\", ",": "\\,", " ": "\\ ", "=": "\\="})
+_MEASUREMENT_ESCAPES = str.maketrans({"\\": "\\\\", ",": "\\,", " ": "\\ "})
+
+
+def encode_key(measurement, tags):
+    """Returns the `measurement,tag=value,...` series key. Tags are sorted, which is what influx stores them as."""
+    key = measurement.translate(_MEASUREMENT_ESCAPES)
+    for tag, value in sorted(tags.items()):
+        if value is None or value == "":
+            continue  # influx rejects empty tag values
+        key += f",{tag.translate(_TAG_ESCAPES)}={str(value).translate(_TAG_ESCAPES)}"
+    return key
+
+
+def encode_field(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def encode_point(measurement, tags, fields, time):
+    """Encodes a single point. Fields that influx can't store (None, NaN, inf) are dropped.
+    Returns None if there are no fields left, as influx rejects those points.
+    """
+    fields = ",".join(
+        f"{key.translate(_TAG_ESCAPES)}={encode_field(val)}"
+        for key, val in sorted(fields.items())
+        if val is not None and not (isinstance(val, float) and not math.isfinite(val))
+    )
+    if not fields:
+        return None
+    return f"{encode_key(measurement, tags)} {fields} {int(time)}"
+
+
+def encode_candles(measurement, tags, batch, string_fields=False):
+    """Encodes a CandleBatch, sharing one series key for every line. string_fields writes the prices and volume as
+    strings, for series that have always been stored that way (influx rejects a float into a string field).
+    """
+    key = encode_key(measurement, tags)
+    if string_fields:
+        return [
+            f'{key} close="{c!r}",high="{h!r}",low="{lo!r}",open="{o!r}",volume="{v!r}" {t}'
+            for t, o, h, lo, c, v in batch.rows()
+        ]
+    return [
+        f"{key} close={c!r},high={h!r},low={lo!r},open={o!r},volume={v!r} {t}" for t, o, h, lo, c, v in batch.rows()
+    ]
@@ -0,0 +1,132 @@
+from bisect import bisect_left
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+PREFIX = "market_data_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROWS_BUCKETS = (0, 1, 10, 100, 500, 1_000, 5_000, 10_000)
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Histogram(object):
+    """Cumulative-bucket histogram, as prometheus has them. buckets are the upper bounds, +Inf is implied."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Returns [(le, count of observations <= le)], ending with ("+Inf", count)"""
+        out, total = [], 0
+        for le, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            out.append((le, total))
+        return out
+
+
+class SyncMetrics(object):
+    """Counters and histograms for the syncs of one exchange/symbol, i.e. to tell if a sync is bound by the exchange,
+    by the rate limiter, or by influx writes.
+
+    Every sync of the same exchange/symbol shares one instance (see get_metrics()). Set CANDLES_METRICS_DIR to have
+    export() write them there after each sync, as a prometheus textfile (for node_exporter's textfile collector), or
+    as JSON with CANDLES_METRICS_FORMAT=json.
+    """
+
+    HISTOGRAM_BUCKETS = {
+        "api_latency_seconds": LATENCY_BUCKETS,
+        "rate_limit_wait_seconds": LATENCY_BUCKETS,
+        "write_latency_seconds": LATENCY_BUCKETS,
+        "rows_per_response": ROWS_BUCKETS,
+    }
+
+    def __init__(self, exchange, symbol):
+        self.labels = {"exchange": exchange, "symbol": symbol}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(self.HISTOGRAM_BUCKETS.get(name, LATENCY_BUCKETS))
+            self.histograms[name].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Observes the seconds spent in the block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Returns everything recorded so far, as a JSON-able dict"""
+        with self._lock:
+            return {
+                **self.labels,
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: {"count": h.count, "sum": h.sum, "buckets": {str(le): n for le, n in h.cumulative()}}
+                    for name, h in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self):
+        """Returns the metrics in the prometheus text exposition format"""
+        labels = ",".join(f'{key}="{value}"' for key, value in self.labels.items())
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                lines.append(f"{PREFIX}{name}_total{{{labels}}} {value}")
+            for name, h in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for le, count in h.cumulative():
+                    lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{PREFIX}{name}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{PREFIX}{name}_count{{{labels}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None, fmt=None):
+        """Writes the metrics to path (default CANDLES_METRICS_DIR), one file per exchange/symbol. No-op if unset."""
+        path = path or os.getenv("CANDLES_METRICS_DIR")
+        if not path:
+            return None
+        fmt = fmt or os.getenv("CANDLES_METRICS_FORMAT", "prom")
+        os.makedirs(path, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", f"{self.labels['exchange']}_{self.labels['symbol']}")
+        fname = os.path.join(path, f"{name}.{fmt}")
+        data = json.dumps(self.snapshot(), indent=2) if fmt == "json" else self.to_prometheus()
+        # written aside and renamed, so collectors never read half a file. Per thread, as periods export concurrently
+        tmp = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as fh:
+            fh.write(data)
+        os.replace(tmp, fname)
+        return fname
+
+
+def get_metrics(exchange, symbol):
+    """Returns the SyncMetrics shared by every sync of this exchange/symbol in the process"""
+    key = (exchange, symbol)
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = SyncMetrics(exchange, symbol)
+        return _registry[key]
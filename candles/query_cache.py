@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class QueryCache(object):
+    """In-process LRU cache of Candles query results, with a TTL.
+
+    Entries belong to a series, (db, measurement, symbol), and cover a [start, end] range in ms (None is unbounded).
+    Writes through Candles invalidate the entries of the series they touch whose range overlaps the written points,
+    so a cached result never predates a write made by this process. Writes from other processes are only picked up
+    once the TTL expires.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, series, start, end, value), oldest use first
+        self._keys = {}  # series -> set of keys, for invalidation
+        self._generations = {}  # series -> write counter, so results queried before a write aren't cached after it
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (True, value) on a hit, (False, None) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[4]
+
+    def generation(self, series):
+        """Call before querying, and pass to put(), so a write in between keeps the (possibly stale) result out"""
+        return self._generations.get(series, 0)
+
+    def put(self, key, value, series, start, end, generation):
+        with self._lock:
+            if self._generations.get(series, 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, series, start, end, value)
+            self._keys.setdefault(series, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, series, start=None, end=None):
+        """Drops the series' entries overlapping [start, end] (ms, None is unbounded). Call it for every write,
+        even with nothing cached for the series: a query already running may put() its pre-write result otherwise.
+        """
+        with self._lock:
+            self._generations[series] = self._generations.get(series, 0) + 1
+            for key in list(self._keys.get(series, ())):
+                _, _, entry_start, entry_end, _ = self._entries[key]
+                if (end is None or entry_start is None or entry_start <= end) and (
+                    start is None or entry_end is None or entry_end >= start
+                ):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def _remove(self, key):
+        _, series, _, _, _ = self._entries.pop(key)
+        self._keys[series].discard(key)
+        if not self._keys[series]:
+            del self._keys[series]
+
+
+def get_query_cache():
+    """Returns the process wide QueryCache, holding up to CANDLES_QUERY_CACHE_SIZE results for
+    CANDLES_QUERY_CACHE_TTL seconds (default 60). None if the size isn't set, which disables caching.
+    """
+    global _cache
+    size = int(os.getenv("CANDLES_QUERY_CACHE_SIZE", 0))
+    if not size:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.max_entries != size:
+            _cache = QueryCache(size, float(os.getenv("CANDLES_QUERY_CACHE_TTL", 60)))
+        return _cache
@@ -0,0 +1,134 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """Weight-aware token bucket, shared by everything that talks to the same exchange.
+
+    Tokens refill continuously at (limit - burst) / period, and at most `burst` tokens can be saved up. That way no
+    rolling `period` ever sees more than `limit` weight spent, so we can run right up against the exchange limit
+    without tripping a 429 (or a 418 ban on Binance).
+
+    If state_file is given, the bucket state lives in that file (under an flock), so several processes syncing the
+    same exchange share one budget.
+    """
+
+    def __init__(self, limit, period=60, burst=None, state_file=None):
+        self.limit = limit
+        self.period = period
+        burst = burst if burst is not None else limit // 20
+        # at least 1, or nothing could ever be acquired, and below the limit where possible, so tokens still refill
+        self.burst = max(1, min(burst, limit - 1))
+        self.rate = max(1, limit - self.burst) / period  # tokens per second
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._state = {"tokens": self.burst, "updated": time.time(), "blocked_until": 0}
+
+    def _load(self, fh):
+        fh.seek(0)
+        raw = fh.read()
+        if raw:
+            try:
+                return json.loads(raw)
+            except ValueError:
+                logger.warning(f"Ignoring corrupt rate limit state in {self.state_file}")
+        return {"tokens": self.burst, "updated": time.time(), "blocked_until": 0}
+
+    def _save(self, fh, state):
+        fh.seek(0)
+        fh.truncate()
+        fh.write(json.dumps(state))
+        fh.flush()
+
+    def _update(self, func):
+        """Runs func(state) -> result under the in-process lock (and the file lock when shared between processes),
+        persisting any changes it makes to the state.
+        """
+        with self._lock:
+            if not self.state_file:
+                return func(self._state)
+            with open(self.state_file, "a+") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    state = self._load(fh)
+                    res = func(state)
+                    self._save(fh, state)
+                    return res
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _take(self, state, weight):
+        """Takes weight tokens if they are available. Returns 0 on success, otherwise the seconds to wait."""
+        now = time.time()
+        state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * self.rate)
+        state["updated"] = now
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now
+        if state["tokens"] >= weight:
+            state["tokens"] -= weight
+            return 0
+        return (weight - state["tokens"]) / self.rate
+
+    def acquire(self, weight=1):
+        """Blocks until `weight` tokens are available, and takes them. Returns the number of seconds spent waiting."""
+        weight = min(weight, self.burst)  # a request heavier than the burst would never fit otherwise
+        waited = 0
+        while True:
+            wait = self._update(lambda state: self._take(state, weight))
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, weight=1):
+        """Same as acquire(), but waits without blocking the event loop. A shared bucket is updated in the default
+        executor, as another process may be holding the file lock.
+        """
+        weight = min(weight, self.burst)
+        waited = 0
+        while True:
+            if self.state_file:
+                wait = await asyncio.get_running_loop().run_in_executor(
+                    None, self._update, lambda state: self._take(state, weight)
+                )
+            else:
+                wait = self._update(lambda state: self._take(state, weight))
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def penalize(self, seconds):
+        """Blocks every caller for `seconds`, and empties the bucket. Use when the exchange tells us to back off."""
+
+        def _block(state):
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+            state["tokens"] = 0
+
+        self._update(_block)
+
+
+def get_rate_limiter(exchange, limit, period=60, burst=None):
+    """Returns the TokenBucket for the exchange, creating it on first use. Every sync instance for an exchange gets
+    the same one. Set CANDLES_RATE_LIMIT_DIR to also share it with other processes on this host.
+    """
+    if not limit:
+        return None
+    key = (exchange, limit, period)
+    with _limiters_lock:
+        if key not in _limiters:
+            state_file = None
+            if os.getenv("CANDLES_RATE_LIMIT_DIR"):
+                os.makedirs(os.getenv("CANDLES_RATE_LIMIT_DIR"), exist_ok=True)
+                state_file = os.path.join(os.getenv("CANDLES_RATE_LIMIT_DIR"), f"{exchange}.json")
+            _limiters[key] = TokenBucket(limit, period=period, burst=burst, state_file=state_file)
+        return _limiters[key]
@@ -0,0 +1,97 @@
+import datetime
+
+from loguru import logger
+
+from candles.candles import Candles
+from candles.line_protocol import encode_point
+
+INTERVAL_SECONDS = {"m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+# OHLCV of each bucket, named like the source fields so the points can be written back as they are
+AGGREGATES = "FIRST(open) AS open, MAX(high) AS high, MIN(low) AS low, LAST(close) AS close, SUM(volume) AS volume"
+FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def interval_to_seconds(interval):
+    """Converts 1m, 4h, 1d style intervals to seconds"""
+    return int(interval[:-1]) * INTERVAL_SECONDS[interval[-1]]
+
+
+class Resampler(object):
+    """Builds higher interval candles (5m, 15m, 4h, 1d, ...) from the candles_1m already in influx, and writes them
+    to candles_<interval>, so they don't cost any exchange requests.
+
+    The aggregation runs in influx (GROUP BY time(interval)), one query per MAX_BUCKETS_PER_QUERY buckets, and only
+    the buckets overlapping the given range are recomputed. Buckets are aligned to the epoch, like the exchanges do
+    for these intervals (weeks and months aren't supported, as those aren't).
+
+    series_filter is an optional (where, bind_params) to narrow down the source series, see
+    BaseSyncCandles._series_filter(). Every series matching it is resampled, keeping its tags. Pass influx_client to
+    reuse an existing Candles instance.
+    """
+
+    SOURCE_INTERVAL = "1m"
+    MAX_BUCKETS_PER_QUERY = 10_000
+
+    def __init__(self, exchange, symbol, host=None, series_filter=None, influx_client=None):
+        self.symbol = symbol
+        self.influx_client = influx_client or Candles(
+            exchange, symbol, self.SOURCE_INTERVAL, create_if_missing=True, host=host
+        )
+        self.where, self.params = series_filter or ("symbol=$symbol", {"symbol": symbol})
+
+    def resample(self, interval, start=None, end=None):
+        """Recomputes the candles_<interval> buckets overlapping start->end (s), and returns the number written.
+        start defaults to the latest bucket already resampled (it may have been partial), or to the first 1m candle
+        if there's none yet. end defaults to now.
+        """
+        secs = interval_to_seconds(interval)
+        source_secs = interval_to_seconds(self.SOURCE_INTERVAL)
+        assert secs > source_secs and secs % source_secs == 0, f"Can't resample {self.SOURCE_INTERVAL} to {interval}"
+
+        if start is None:
+            start = self._earliest_series_time(f"candles_{interval}", "LAST")
+        if start is None:
+            start = self._earliest_series_time(f"candles_{self.SOURCE_INTERVAL}", "FIRST")
+        if start is None:
+            logger.debug(f"No {self.SOURCE_INTERVAL} candles for {self.symbol} to resample")
+            return 0
+        end = end or int(datetime.datetime.now().timestamp())
+        start -= start % secs
+        end += -end % secs or secs  # up to the end of the bucket end is in
+
+        written = 0
+        for chunk_start in range(start, end, secs * self.MAX_BUCKETS_PER_QUERY):
+            chunk_end = min(end, chunk_start + secs * self.MAX_BUCKETS_PER_QUERY)
+            written += self._resample_range(interval, chunk_start, chunk_end)
+        logger.debug(f"Resampled {written} {interval} candles for {self.symbol}, {start} to {end}")
+        return written
+
+    def _resample_range(self, interval, start, end):
+        params = dict(self.params, start=start * 1_000_000_000, end=end * 1_000_000_000)
+        res = self.influx_client.query(
+            f"SELECT {AGGREGATES} FROM candles_{self.SOURCE_INTERVAL} WHERE {self.where} AND time >= $start "
+            f"AND time < $end GROUP BY time({interval}), * fill(none)",
+            bind_params=params,
+        )
+        lines = []
+        for (_, tags), points in res.items():
+            tags = dict(tags, interval=interval)
+            for point in points:
+                line = encode_point(
+                    f"candles_{interval}", tags, {field: point[field] for field in FIELDS}, point["time"]
+                )
+                if line:
+                    lines.append(line)
+        if lines:
+            self.influx_client.write_lines(lines)
+        return len(lines)
+
+    def _earliest_series_time(self, measurement, selector):
+        """Returns the earliest of each series' FIRST/LAST candle time in measurement (s), or None if it's empty.
+        With several series (i.e. funding periods), the one furthest behind decides.
+        """
+        res = self.influx_client.query(
+            f"SELECT {selector}(close) FROM {measurement} WHERE {self.where} GROUP BY *", bind_params=self.params
+        )
+        times = [point["time"] // 1_000 for _, points in res.items() for point in points]
+        return min(times) if times else None
@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from loguru import logger
+
+GZIP_LEVEL = 5
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class ResponseCache(object):
+    """On-disk cache of raw exchange responses, so re-ingesting history (a rebuilt db, a schema change, a fixed bug
+    in write_candles) doesn't have to go back to the exchange for it.
+
+    Entries are gzipped JSON files named by the sha256 of the request (see key()), and evicted least recently used
+    first once the cache grows over max_bytes. Only responses that can't change any more should be put in it; see
+    BaseSyncCandles.RESPONSE_CACHE_SETTLE_SECS.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # bytes on disk, counted on the first put()
+
+    @staticmethod
+    def key(exchange, endpoint, params):
+        request = json.dumps([exchange, endpoint, params], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".json.gz")
+
+    def get(self, key):
+        """Returns the cached response, or None on a miss"""
+        fname = self._file(key)
+        try:
+            with gzip.open(fname, "rt") as fh:
+                response = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError):
+            logger.warning(f"Dropping corrupt response cache entry {fname}")
+            self._remove(fname)
+            return None
+        try:
+            os.utime(fname)  # mtime is the last use, for eviction
+        except OSError:
+            pass  # evicted by another process in the meantime
+        return response
+
+    def put(self, key, response):
+        fname = self._file(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        data = gzip.compress(json.dumps(response, separators=(",", ":")).encode(), GZIP_LEVEL)
+        tmp = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, fname)  # readers never see a partial file
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """Returns (mtime, size, path) for every entry"""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                fname = os.path.join(root, name)
+                try:
+                    stat = os.stat(fname)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, fname))
+        return entries
+
+    def _evict(self):
+        """Removes the least recently used entries, until the cache is down to 90% of max_bytes. The whole cache is
+        re-counted, as other processes may share it.
+        """
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, fname in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            self._remove(fname)
+            self._size -= size
+        logger.debug(f"Evicted response cache entries, {self._size / 1_000_000:.1f}MB left in {self.path}")
+
+    @staticmethod
+    def _remove(fname):
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
+
+def get_response_cache():
+    """Returns the ResponseCache at CANDLES_RESPONSE_CACHE_DIR, limited to CANDLES_RESPONSE_CACHE_MAX_MB (default
+    10GB). None if the dir isn't set, which disables caching.
+    """
+    path = os.getenv("CANDLES_RESPONSE_CACHE_DIR")
+    if not path:
+        return None
+    with _caches_lock:
+        if path not in _caches:
+            max_mb = int(os.getenv("CANDLES_RESPONSE_CACHE_MAX_MB", 10_000))
+            _caches[path] = ResponseCache(path, max_mb * 1_000_000)
+        return _caches[path]
@@ -0,0 +1,101 @@
+import asyncio
+import email.utils
+import random
+import time
+
+from loguru import logger
+import aiohttp
+import requests
+
+
+def error_status(err):
+    """Returns the HTTP status of a failed exchange request, from either a requests or an aiohttp error. None if the
+    request never got a response (connection error, timeout, ...).
+    """
+    response = getattr(err, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return response.status_code
+    return getattr(err, "status", None)
+
+
+def retry_after(err):
+    """Returns the seconds the exchange asked us to wait in its Retry-After header, or None"""
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or getattr(err, "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:  # the header can also be an HTTP date
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_network_error(err):
+    """True for errors where the request never got an answer, which are always worth another try"""
+    return isinstance(
+        err,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            aiohttp.ClientConnectionError,
+            asyncio.TimeoutError,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
+
+
+class Retry(object):
+    """Retries a callable with exponential backoff and full jitter, honoring Retry-After when the exchange sends one.
+
+    is_retryable(err) decides which errors get another attempt, anything else is raised straight away.
+    on_backoff(err, delay), if given, is called before each wait, i.e. to slow down every other caller as well.
+    """
+
+    def __init__(self, is_retryable, max_attempts=5, base_delay=1, max_delay=60, on_backoff=None):
+        self.is_retryable = is_retryable
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_backoff = on_backoff
+
+    def delay(self, attempt, err):
+        """Seconds to wait after the attempt'th (from 1) failure"""
+        wait = retry_after(err)
+        if wait is not None:
+            return wait
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _backoff(self, attempt, err):
+        """Returns the seconds to wait before the next attempt, or raises err if we shouldn't try again"""
+        if attempt >= self.max_attempts or not self.is_retryable(err):
+            raise err
+        wait = self.delay(attempt, err)
+        logger.warning(f"Request failed ({err!r}), attempt {attempt}/{self.max_attempts}. Retrying in {wait:.1f}s")
+        if self.on_backoff:
+            self.on_backoff(err, wait)
+        return wait
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:
+                time.sleep(self._backoff(attempt, err))
+
+    async def call_async(self, func, *args, **kwargs):
+        """Same as call(), for coroutine functions"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(*args, **kwargs)
+            except Exception as err:
+                await asyncio.sleep(self._backoff(attempt, err))
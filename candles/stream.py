@@ -0,0 +1,109 @@
+import asyncio
+import copy
+import json
+
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+from loguru import logger
+import aiohttp
+import requests
+
+# the stream reconnects on these too: the candles that failed to write are kept, and written once reconnected
+WRITE_ERRORS = (requests.RequestException, InfluxDBClientError, InfluxDBServerError)
+
+
+class CandleStream(object):
+    """Long running live ingest for a sync instance, from the exchange's candle push feed (see
+    BaseSyncCandles.STREAM_URL and parse_stream_message()).
+
+    Candles are written once the exchange marks them closed, in micro-batches: whenever FLUSH_SIZE candles are
+    waiting, or FLUSH_SECONDS after the first of them arrived, whichever comes first.
+    Every (re)connection also runs the REST sync from the latest candle in the db, so whatever was missed while the
+    stream was down is filled in. Candles written by both are the same points, so overlap is harmless.
+
+        asyncio.run(CandleStream(get_sync_candles_class("binance", "BTCUSDT", "1m")).run())
+    """
+
+    FLUSH_SECONDS = 5
+    FLUSH_SIZE = 500
+    HEARTBEAT = 30  # seconds between pings, so a dead connection is noticed
+    RECONNECT_DELAY = 1  # doubled after each failed connection, up to MAX_RECONNECT_DELAY
+    MAX_RECONNECT_DELAY = 60
+
+    def __init__(self, client, url=None):
+        assert url or client.STREAM_URL, f"No candle stream for {client.EXCHANGE}"
+        self.client = client
+        self.url = url or client.stream_url()
+        self.pending = []  # closed candles waiting to be written
+        self._flush_at = None
+        self._backfill = None  # REST sync task, see backfill()
+        self._delay = self.RECONNECT_DELAY
+
+    async def run(self):
+        """Streams until cancelled, reconnecting (and backfilling) whenever the connection drops"""
+        async with self.client._async_session():
+            try:
+                while True:
+                    try:
+                        await self._consume()
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, *WRITE_ERRORS) as err:
+                        logger.warning(f"{self.client.EXCHANGE} {self.client.symbol} stream dropped: {err!r}")
+                    await asyncio.sleep(self._delay)
+                    self._delay = min(self._delay * 2, self.MAX_RECONNECT_DELAY)
+            finally:
+                if self._backfill:
+                    self._backfill.cancel()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        async with self.client.http_session.ws_connect(self.url, heartbeat=self.HEARTBEAT) as ws:
+            logger.info(f"Streaming {self.client.EXCHANGE} {self.client.symbol} {self.client.interval} candles")
+            self._delay = self.RECONNECT_DELAY
+            if not self._backfill or self._backfill.done():  # one still running covers this reconnect too
+                self._backfill = asyncio.ensure_future(self.backfill())
+            try:
+                while True:
+                    timeout = max(0, self._flush_at - loop.time()) if self.pending else None
+                    try:
+                        msg = await ws.receive(timeout=timeout)
+                    except asyncio.TimeoutError:
+                        await self.flush()
+                        continue
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        raise ConnectionError(f"stream closed ({msg.type.name})")
+
+                    candle = self.client.parse_stream_message(json.loads(msg.data))
+                    if candle is None:
+                        continue  # not closed yet, or not a candle
+                    if not self.pending:
+                        self._flush_at = loop.time() + self.FLUSH_SECONDS
+                    self.pending.append(candle)
+                    if len(self.pending) >= self.FLUSH_SIZE:
+                        await self.flush()
+            finally:
+                await self.flush()
+
+    async def flush(self):
+        """Writes the pending candles. They stay pending if the write fails."""
+        if not self.pending:
+            return
+        candles, self.pending = self.pending, []
+        try:
+            await self.client._run_blocking(self.client.write_candles, candles)
+        except BaseException:
+            self.pending = candles + self.pending
+            raise
+        self.client.metrics.count("stream_candles_written", len(candles))
+
+    async def backfill(self):
+        """REST sync from the latest candle in the db to now. Runs on a copy of the client, as the stream keeps
+        writing through the original meanwhile.
+        """
+        client = copy.copy(self.client)
+        client.start = client.end = None  # plan from the db, up to now
+        endpoint, kwargs = client.sync_args()
+        try:
+            await client.async_sync(endpoint, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Backfilling {client.EXCHANGE} {client.symbol} failed, retrying on the next reconnect")
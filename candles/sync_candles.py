@@ -1,17 +1,85 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import copy
 import datetime
+import functools
 import math
+import queue
 import sys
+import threading
+import time
 
 from exchanges.apis.binance import BinanceApi
 from exchanges.apis.bitfinex import BitfinexApi
 from exchanges.apis.sfox import SFOXApi
 from loguru import logger
-from ratelimit import limits, sleep_and_retry
+import aiohttp
 import arrow
 
+from candles.batch import CandleBatch
 from candles.candles import Candles
+from candles.line_protocol import encode_candles, encode_point
+from candles.metrics import get_metrics
+from candles.rate_limit import get_rate_limiter
+from candles.resample import Resampler
+from candles.response_cache import get_response_cache
+from candles.retry import Retry, error_status, is_network_error
+from candles.sync_state import get_sync_state
 
 IS_PYTEST = "pytest" in sys.modules
+_DONE = object()  # end of stream marker for the write queue
+MAX_TIMESTAMP = 32_503_680_000  # epochs past year 3000 in s are taken as ms, then us, like arrow.get() does
+
+
+def epoch_seconds(value):
+    """Returns integer epoch seconds for an epoch in s, ms or us, or an ISO 8601 string (naive ones are UTC).
+    Same as arrow.get(value).int_timestamp, without building an Arrow object per row.
+    """
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return arrow.get(value).int_timestamp  # anything else arrow understands
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return int(parsed.timestamp())
+    value = int(value)
+    while abs(value) >= MAX_TIMESTAMP:
+        value //= 1_000
+    return value
+
+
+def merge_ranges(ranges, gap=0):
+    """Returns the (start, end) ranges sorted, with the ones overlapping or at most gap apart merged"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(ranges, excluded):
+    """Returns the parts of the [start, end) ranges that none of the excluded ones cover"""
+    excluded = merge_ranges(excluded)
+    remaining = []
+    for start, end in ranges:
+        for excluded_start, excluded_end in excluded:
+            if excluded_end <= start or excluded_start >= end:
+                continue
+            if excluded_start > start:
+                remaining.append((start, excluded_start))
+            start = excluded_end
+        if start < end:
+            remaining.append((start, end))
+    return remaining
+
+
+def _isoformat(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
 
 def get_sync_candles_class(exchange, symbol, interval, start=None, end=None, host=None):
@@ -24,6 +92,16 @@ def get_sync_candles_class(exchange, symbol, interval, start=None, end=None, hos
         return SyncSFOXCandles(symbol, interval, start, end, host)
 
 
+async def pull_all_async(clients):
+    """Runs async_pull_data() for many sync instances on one event loop, sharing one HTTP session. Requests are
+    still bound by each exchange's shared rate limiter, rather than by a thread per symbol.
+    """
+    async with aiohttp.ClientSession() as session:
+        for client in clients:
+            client.http_session = session
+        return await asyncio.gather(*(client.async_pull_data() for client in clients))
+
+
 class BaseSyncCandles(object):
     """Base class for syncing candles
     NOTE candles must come in oldest->newest order. Thanks.
@@ -31,13 +109,38 @@ class BaseSyncCandles(object):
 
     BIN_SIZES = {"1m": 1, "1h": 60, "1d": 1440}
     API_MAX_RECORDS = 10_000
+    API_CONCURRENCY = 1  # windows fetched at once in do_fetch(). Calls are still bound by API_CALLS_PER_MIN
+    PAGINATION = "windows"  # "windows": split the range evenly up front. "cursor": follow the returned candles
+    CURSOR_OVERLAP = 1  # candles re-requested at the start of each cursor page, so nothing falls between pages
+    WRITE_QUEUE_SIZE = 2  # fetched windows allowed to wait for the influx writer. 0 writes inline, after each fetch
+    API_CALLS_PER_MIN = None  # request weight per minute, shared by every instance for the exchange
+    RESAMPLE_INTERVALS = ()  # higher intervals to rebuild from the 1m candles each sync writes, see resample_written()
+    REPAIR_GAPS = False  # also refetch holes between the earliest and latest candles in the db, see get_gap_ranges()
+    GAP_BUCKET = "1d"  # granularity of the gap scan: any bucket with fewer candles than expected gets refetched
+    API_WEIGHTS = {}  # endpoint -> request weight, for exchanges that don't count every call as 1
+    API_MAX_ATTEMPTS = 5  # tries per request, for errors is_retryable() allows. Backoff doubles from API_RETRY_DELAY
+    API_RETRY_DELAY = 1
+    API_MAX_RETRY_DELAY = 60
+    RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+    RATE_LIMITED_STATUS_CODES = {429}  # the exchange wants everyone to back off, not just this request
+    RATE_LIMIT_PENALTY = 0  # minimum seconds every request to the exchange is held off after a rate limit error
+    API_BASE_URL = None  # REST root used by async_api_request()
+    STREAM_URL = None  # candle push feed (a websocket), formatted with the lowercase symbol and interval
+    SKIP_UNCHANGED_CANDLES = True  # don't rewrite candles that are already in the db with the same values
+    QUARANTINE_INVALID_CANDLES = True  # write candles failing validation aside, rather than failing the whole window
+    RESPONSE_CACHE_SETTLE_SECS = 3600  # windows ending later than this long ago may still change, so aren't cached
+    STRING_FIELDS = False  # write OHLCV as string fields, for exchanges whose series have always been stored that way
     EXCHANGE = None
     DEFAULT_SYNC_DAYS = 90
     start = end = client = None
+    http_session = None  # aiohttp session for the async_* methods, see pull_all_async()
+    _pending_legs = None  # ranges the running sync still has to fetch, see _iter_legs()
+    _last_written = None  # {ts: values} of the newest candles in the db, see _drop_unchanged()
+    _written_ranges = ()  # [(first, last)] candle timestamps (s) written by the running sync, see merge_ranges()
+    candle_order = candle_dict_keys = None  # where each candle column is in the exchange's rows, see to_candle_batch()
     ALLOWED_DATA_TYPES = ["candles", "futures", "funding_rates"]
 
     def __init__(self, symbol, interval, start=None, end=None, host=None, data_type="candles"):
-        self.candle_order = None
         self.symbol = symbol
         self.interval = interval
         if start:
@@ -56,20 +159,146 @@ class BaseSyncCandles(object):
             data_type=self.data_type,
         )
         self.client = self.api_client()
+        self.rate_limiter = get_rate_limiter(self.EXCHANGE, self.API_CALLS_PER_MIN)
+        self.retry = Retry(
+            self.is_retryable,
+            max_attempts=self.API_MAX_ATTEMPTS,
+            base_delay=self.API_RETRY_DELAY,
+            max_delay=self.API_MAX_RETRY_DELAY,
+            on_backoff=self.on_backoff,
+        )
+        self.sync_state = get_sync_state()
+        self.response_cache = get_response_cache()
+        self.metrics = get_metrics(self.EXCHANGE, self.symbol)
 
     def api_client(self):
         "Abstract Method: must be implemented in the child class, and populate self.client " ""
         raise NotImplementedError
 
-    def call_api(self):
-        "Abstract Method: must be implemented in the child class " ""
+    def api_request(self, endpoint, params):
+        "Abstract Method: must be implemented in the child class, and make the actual exchange request " ""
+        raise NotImplementedError
+
+    def api_weight(self, endpoint, params):
+        """Returns the request weight the exchange charges for this call"""
+        return self.API_WEIGHTS.get(endpoint, 1)
+
+    def is_retryable(self, err):
+        """Whether a failed request is worth another try: network errors, and RETRYABLE_STATUS_CODES"""
+        status = error_status(err)
+        if status is None:
+            return is_network_error(err)
+        return status in self.RETRYABLE_STATUS_CODES
+
+    def on_backoff(self, err, delay):
+        """Called before waiting to retry. When the exchange says we're rate limited, hold off every request to it
+        (in this process, and others sharing CANDLES_RATE_LIMIT_DIR) for as long, so we slow down instead of getting
+        banned.
+        """
+        self.metrics.count("api_retries")
+        if self.rate_limiter and error_status(err) in self.RATE_LIMITED_STATUS_CODES:
+            self.rate_limiter.penalize(max(delay, self.RATE_LIMIT_PENALTY))
+
+    def call_api(self, endpoint, params):
+        """Rate limited exchange request. Blocks until the exchange's shared budget allows the call, and retries
+        failures that is_retryable() allows, with backoff.
+        """
+        return self.retry.call(self._call_api_once, endpoint, params)
+
+    def _call_api_once(self, endpoint, params):
+        if self.rate_limiter:
+            self.metrics.observe(
+                "rate_limit_wait_seconds", self.rate_limiter.acquire(self.api_weight(endpoint, params))
+            )
+        self.metrics.count("api_calls")
+        with self.metrics.timer("api_latency_seconds"):
+            return self.api_request(endpoint, params)
+
+    async def async_api_request(self, endpoint, params):
+        """GETs API_BASE_URL + endpoint with aiohttp. Exchanges whose API needs more than that should override it."""
+        async with self.http_session.get(self.API_BASE_URL + endpoint, params=params) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    async def async_call_api(self, endpoint, params):
+        """asyncio version of call_api(): waits for the rate limiter, and between retries, without blocking the
+        event loop
+        """
+        return await self.retry.call_async(self._async_call_api_once, endpoint, params)
+
+    async def _async_call_api_once(self, endpoint, params):
+        if self.rate_limiter:
+            waited = await self.rate_limiter.acquire_async(self.api_weight(endpoint, params))
+            self.metrics.observe("rate_limit_wait_seconds", waited)
+        self.metrics.count("api_calls")
+        with self.metrics.timer("api_latency_seconds"):
+            return await self.async_api_request(endpoint, params)
+
+    def sync_args(self):
+        "Abstract Method: returns (endpoint, kwargs) for sync(), must be implemented in the child class " ""
         raise NotImplementedError
 
+    def stream_url(self):
+        return self.STREAM_URL.format(symbol=self.symbol.lower(), interval=self.interval)
+
+    def parse_stream_message(self, message):
+        "Abstract Method: returns the candle in a STREAM_URL message once it's closed, otherwise None " ""
+        raise NotImplementedError
+
+    def pull_data(self):
+        endpoint, kwargs = self.sync_args()
+        self.sync(endpoint, **kwargs)
+
+    async def async_pull_data(self):
+        """asyncio version of pull_data()"""
+        async with self._async_session():
+            endpoint, kwargs = self.sync_args()
+            await self.async_sync(endpoint, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def _async_session(self):
+        """Makes sure there's an http_session for the async_* methods. Opens (and closes) one if none was given."""
+        if self.http_session:
+            yield self.http_session
+            return
+        async with aiohttp.ClientSession() as session:
+            self.http_session = session
+            try:
+                yield session
+            finally:
+                self.http_session = None
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Runs blocking (influx) calls in the default executor, so they don't stall the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
     def get_earliest_latest_timestamps_in_db(self):
         """Returns (earliest,latest) timestamp in the database for the current symbol/interval, or 0 if there
-        isn't one
+        isn't one. Read from the local sync state store when one is configured (CANDLES_SYNC_STATE_DB), and
+        only from influx when it has no trusted entry for the series.
         """
+        if not self.sync_state:
+            return self._query_earliest_latest()
+
+        key = self._series_key()
+        watermarks = self.sync_state.get_watermarks(key)
+        if watermarks is None:
+            watermarks = self._query_earliest_latest()
+            self.sync_state.set_watermarks(key, *watermarks)
+        return watermarks
+
+    def _series_key(self):
+        """Identifies this series in the sync state store"""
+        _, params = self._series_filter()
+        return (
+            self.EXCHANGE,
+            self.interval,
+            self.data_type,
+            ",".join(f"{key}={val}" for key, val in sorted(params.items())),
+        )
 
+    def _query_earliest_latest(self):
+        """Asks influx for the (earliest, latest) timestamps, see get_earliest_latest_timestamps_in_db()"""
         query = "SELECT open,time FROM candles_{} WHERE symbol=$symbol".format(self.interval)
         params = {"symbol": self.symbol}
 
@@ -78,8 +307,8 @@ class BaseSyncCandles(object):
 
         # NOTE: all candles are stored in influx as ms. So convert to s when retrieving, and later we up-convert to ms
         # or us if required by the exchange. When querying manually, run influx with: `influx -precision=ms` /!\
-        earliest = arrow.get(list(earliest)[0][0]["time"] / 1_000).int_timestamp if earliest else 0
-        latest = arrow.get(list(latest)[0][0]["time"] / 1_000).int_timestamp if latest else 0
+        earliest = list(earliest)[0][0]["time"] // 1_000 if earliest else 0
+        latest = list(latest)[0][0]["time"] // 1_000 if latest else 0
         return earliest, latest
 
     def get_iterations_for_range(self, batch_limit):
@@ -108,7 +337,8 @@ class BaseSyncCandles(object):
         else:
             delta_mins = abs((latest - (self.end))) / 60
             new_start = latest
-        data_to_fetch = math.ceil(delta_mins / self.BIN_SIZES[self.interval])
+        bin_size = self.BIN_SIZES.get(self.interval) or self._interval_to_seconds(self.interval) / 60
+        data_to_fetch = math.ceil(delta_mins / bin_size)
         return (
             math.ceil(data_to_fetch / batch_limit),
             new_start,
@@ -116,6 +346,87 @@ class BaseSyncCandles(object):
             fetch_again_from_ts,
         )
 
+    def _series_filter(self):
+        """Returns (where, bind_params) selecting this series in influx queries"""
+        return "symbol=$symbol", {"symbol": self.symbol}
+
+    def get_gap_ranges(self, start, end):
+        """Returns [(start, end), ...] ranges between start and end (in seconds) where candles are missing.
+        Built from one COUNT() per GAP_BUCKET, so it's cheap no matter how much history there is. Adjacent incomplete
+        buckets are merged into a single range.
+        """
+        candle_secs = self._interval_to_seconds(self.interval)
+        bucket_secs = self._interval_to_seconds(self.GAP_BUCKET)
+        where, params = self._series_filter()
+        params.update({"start": int(start * 1e9), "end": int(end * 1e9)})
+        res = self.influx_client.query(
+            f"SELECT COUNT(open) FROM candles_{self.interval} WHERE {where} AND time >= $start AND time < $end "
+            f"GROUP BY time({self.GAP_BUCKET}) fill(0)",
+            bind_params=params,
+        )
+
+        gaps = []
+        for bucket in res.get_points():
+            bucket_start = max(bucket["time"] // 1_000, start)
+            bucket_end = min(bucket["time"] // 1_000 + bucket_secs, end)
+            expected = -(-bucket_end // candle_secs) + (-bucket_start // candle_secs)  # candle slots in the bucket
+            if bucket["count"] >= expected:
+                continue
+            if gaps and gaps[-1][1] == bucket_start:
+                gaps[-1] = (gaps[-1][0], bucket_end)
+            else:
+                gaps.append((bucket_start, bucket_end))
+        return gaps
+
+    def repair_gaps(self, endpoint, extra_params, extra_tags, **kwargs):
+        """Refetches only the holes between the earliest and latest candles in the db (within start/end), so
+        repairing an outage costs as many requests as the outage is long, rather than a resync of all history.
+        """
+        for gap_start, gap_end in self._gaps_to_repair():
+            self.do_fetch(
+                self._time_steps(gap_start, gap_end), gap_start, gap_end, endpoint, extra_params, extra_tags, **kwargs
+            )
+            self._gap_repaired(gap_start, gap_end)
+
+    def _gaps_to_repair(self):
+        """Gap ranges between the earliest and latest candles in the db, within start/end, less the ones already
+        repaired (see SyncStateStore.get_repaired_gaps())
+        """
+        earliest, latest = self.get_earliest_latest_timestamps_in_db()
+        if not latest:
+            return []
+        # latest is inclusive, so scan up to the slot after it
+        start, end = max(self.start, earliest), min(self.end, latest + self._interval_to_seconds(self.interval))
+        if start >= end:
+            return []
+        gaps = self.get_gap_ranges(start, end)
+        if self.sync_state:
+            gaps = subtract_ranges(gaps, self.sync_state.get_repaired_gaps(self._series_key()))
+        for gap_start, gap_end in gaps:
+            logger.info(f"Repairing gap for {self.symbol} from {gap_start} to {gap_end}")
+        return gaps
+
+    def _gap_repaired(self, start, end):
+        """Called once a gap is refetched. Anything still missing there isn't on the exchange either, so the sync state
+        store keeps it from being refetched by every run.
+        """
+        if self.sync_state:
+            self.sync_state.add_repaired_gap(self._series_key(), start, end)
+
+    def _time_steps(self, start, end):
+        """timestamp_ranges() for start to end, with as many API_MAX_RECORDS sized requests as it takes. With a
+        response cache, split on a fixed grid of API_MAX_RECORDS candles instead, so that syncs of the same history
+        request the same windows whatever their start and end (see _response_cache_window()).
+        """
+        if self.response_cache and self.API_MAX_RECORDS and start < end:
+            size = self.API_MAX_RECORDS * self._interval_to_seconds(self.interval)
+            return [start, *range(start - start % size + size, end, size), end]
+        steps = 1
+        if self.API_MAX_RECORDS:
+            candles = math.ceil((end - start) / self._interval_to_seconds(self.interval))
+            steps = math.ceil(candles / self.API_MAX_RECORDS)
+        return list(self.timestamp_ranges(start, end, steps))
+
     def write_candles(self, candles, extra_tags=None, timestamp_units="ms"):
         """Writes candle data to influxdb."""
         out = []
@@ -130,51 +441,38 @@ class BaseSyncCandles(object):
                 tags.update(extra_tags)
 
         _check_extra_tags(tags)
-        for c in candles:
-            if self.data_type == "candles":
-                # tags don't change in this case, so just use existing tags var
-                if isinstance(c, dict):
-                    _time = c[self.candle_dict_keys["ts"]]
-                    _open = c[self.candle_dict_keys["open"]]
-                    _high = c[self.candle_dict_keys["high"]]
-                    _low = c[self.candle_dict_keys["low"]]
-                    _close = c[self.candle_dict_keys["close"]]
-                    _volume = c[self.candle_dict_keys["volume"]]
-                else:
-                    _time = c[self.candle_order["ts"]]
-                    _open = float(c[self.candle_order["open"]])
-                    _high = float(c[self.candle_order["high"]])
-                    _low = float(c[self.candle_order["low"]])
-                    _close = float(c[self.candle_order["close"]])
-                    _volume = float(c[self.candle_order["volume"]])
-                assert _low <= _high, f"Low price must be <= the High price. Candle: {c}"
-                assert _low <= _close, f"Low price must be <= the Close price. Candle: {c}"
-                assert _high >= _open, f"High price must be <= the Open price. Candle: {c}"
-
-                if timestamp_units == "s":  # write in ms, as that's how we query
-                    _time = int(arrow.get(_time).int_timestamp * 1_000)
-
-                out.append(
-                    {
-                        "measurement": "candles_" + self.interval,
-                        "tags": tags,
-                        "time": _time,
-                        "fields": {
-                            "open": _open,
-                            "high": _high,
-                            "low": _low,
-                            "close": _close,
-                            "volume": _volume,
-                        },
-                    }
+        if self.data_type == "candles":
+            if not isinstance(candles, CandleBatch):
+                candles = self.to_candle_batch(candles, timestamp_units)
+            invalid = candles.invalid_rows()
+            if invalid:
+                candles = self.quarantine_candles(candles, invalid, tags)
+            fetched = candles
+            if self.SKIP_UNCHANGED_CANDLES:
+                candles = self._drop_unchanged(candles)
+            # tags don't change in this case, so just use existing tags var
+            out = encode_candles("candles_" + self.interval, tags, candles, self.STRING_FIELDS)
+            if out:
+                self.influx_client.write_lines(out)
+                first, last = min(candles.ts) // 1_000, max(candles.ts) // 1_000
+                if self.sync_state:
+                    self.sync_state.extend_watermarks(self._series_key(), first, last)
+                self._written_ranges = merge_ranges(
+                    [*self._written_ranges, (first, last)], self._interval_to_seconds(self.interval)
                 )
-            elif self.data_type == "futures" or self.data_type == "funding_rates":
+            if self.SKIP_UNCHANGED_CANDLES:
+                self._remember_written(fetched)
+            return
+
+        if self.data_type == "futures" or self.data_type == "funding_rates":
+            hour = int(time.time()) // 3_600 * 3_600 * 1_000  # ms
+            for c in candles:
                 # currently based on FTX's data format
                 BANNED_TAGS = ["nextFundingTime"]
                 if "time" not in c:
-                    _time = int(arrow.utcnow().floor("hour").int_timestamp * 1_000)  # ms
+                    _time = hour
                 else:
-                    _time = int(arrow.get(c["time"]).int_timestamp)
+                    _time = epoch_seconds(c["time"])
                     if timestamp_units == "s":
                         _time = int(_time * 1_000)
                     del c["time"]  # don't try to add it as a tag
@@ -192,16 +490,81 @@ class BaseSyncCandles(object):
                     elif isinstance(val, float):
                         fields[key] = val
 
-                out.append(
-                    {
-                        "measurement": f"{self.data_type}_{self.interval}",
-                        "tags": tags,
-                        "time": _time,
-                        "fields": fields,
-                    }
-                )
+                line = encode_point(f"{self.data_type}_{self.interval}", tags, fields, _time)
+                if line:
+                    out.append(line)
+
+        if out:
+            self.influx_client.write_lines(out)
+
+    def quarantine_candles(self, candles, invalid, tags):
+        """Writes the candles failing validation (invalid is [(index, reason)], see CandleBatch.invalid_rows()) to the
+        quarantine measurement with their reasons, and returns the batch without them, so that one bad candle doesn't
+        throw away (and refetch) the whole window. Raises instead if QUARANTINE_INVALID_CANDLES is off.
+        """
+        if not self.QUARANTINE_INVALID_CANDLES:
+            candles.validate()
+        reasons = {}
+        for i, reason in invalid:
+            reasons[i] = f"{reasons[i]} {reason}" if i in reasons else reason
+
+        measurement = "quarantine_candles_" + self.interval
+        lines = []
+        for i, reason in reasons.items():
+            ts, _open, high, low, close, volume = candles.row(i)
+            fields = {"open": _open, "high": high, "low": low, "close": close, "volume": volume, "reason": reason}
+            lines.append(encode_point(measurement, tags, fields, ts))
+        self.influx_client.write_lines(lines)
+        self.metrics.count("candles_quarantined", len(lines))
+        logger.warning(
+            f"Quarantined {len(lines)} of {len(candles)} {self.symbol} candles in {measurement}. "
+            f"First: {reasons[min(reasons)]} Candle: {candles.row(min(reasons))}"
+        )
+        return candles.drop(reasons)
 
-        self.influx_client.write_points(out)
+    def _drop_unchanged(self, candles):
+        """Returns the batch without the candles we know are already stored with the same values: the boundary
+        candle every incremental sync starts from, and the overlap between windows/cursor pages. The first call of a
+        sync seeds that from the latest candles in the sync state store, or else the latest candle in the db.
+        """
+        if self._last_written is None:
+            stored = self.sync_state.get_latest_candles(self._series_key()) if self.sync_state else None
+            self._last_written = self._query_latest_candle() if stored is None else stored
+        last = self._last_written
+        # only the few boundary candles can match, so don't build a row tuple for the others
+        unchanged = [i for i, ts in enumerate(candles.ts) if ts in last and last[ts] == candles.row(i)[1:]]
+        if unchanged:
+            self.metrics.count("candles_unchanged", len(unchanged))
+            candles = candles.drop(unchanged)
+        return candles
+
+    def _remember_written(self, candles):
+        """Keeps the values of the newest candles written, as those are the ones the next window (or sync) overlaps"""
+        if len(candles) and candles.ts[-1] >= max(self._last_written or [0]):  # not for gaps repaired behind it
+            tail = range(max(0, len(candles) - self.CURSOR_OVERLAP - 1), len(candles))
+            self._last_written = {candles.ts[i]: candles.row(i)[1:] for i in tail}
+            if self.sync_state:
+                self.sync_state.set_latest_candles(self._series_key(), self._last_written)
+
+    def _query_latest_candle(self):
+        """Returns {ts: (open, high, low, close, volume)} for the latest candle in the db, or {} if there's none.
+        Values are floats, like CandleBatch's, even where they're stored as strings (see STRING_FIELDS).
+        """
+        where, params = self._series_filter()
+        res = self.influx_client.query(
+            f"SELECT open, high, low, close, volume FROM candles_{self.interval} WHERE {where} "
+            "ORDER BY time DESC LIMIT 1",
+            bind_params=params,
+        )
+        fields = ("open", "high", "low", "close", "volume")
+        return {c["time"]: tuple(float(c[field]) for field in fields) for c in res.get_points()}
+
+    def to_candle_batch(self, rows, timestamp_units="ms"):
+        """Converts an exchange response into a CandleBatch, using candle_dict_keys for exchanges that return dicts,
+        and candle_order for those returning lists.
+        """
+        columns = self.candle_dict_keys if rows and isinstance(rows[0], dict) else self.candle_order
+        return CandleBatch.from_rows(rows, columns, timestamp_units)
 
     @staticmethod
     def timestamp_ranges(start, end, steps):
@@ -210,14 +573,13 @@ class BaseSyncCandles(object):
         >>> zip([1,2,3,4,5,6], [1,2,3,4,5,6][1:])
         [(1, 2), (2, 3), (3, 4), (4, 5), (5, 6)]
         """
-        start = arrow.get(start)
-        end = arrow.get(end)
+        start = int(start)
+        end = int(end)
         if not steps:
-            return start, end
-        diff = (end - start) / steps
+            return
         for i in range(steps):
-            yield int((start + diff * i).int_timestamp)
-        yield int(end.int_timestamp)
+            yield start + (end - start) * i // steps
+        yield end
 
     def sync(
         self,
@@ -237,7 +599,104 @@ class BaseSyncCandles(object):
         """
         assert not any(key in extra_params for key in ["limit", "start", "end"]), "Cannot"
         " override the following params: limit, start, end"
+        self._default_range()
+        self._last_written = None  # the db may have changed since the last sync
+        self._written_ranges = []
+
+        kwargs = dict(
+            start_format=start_format,
+            end_format=end_format,
+            timestamp_units=timestamp_units,
+            result_key=result_key,
+            reverse_order=False,
+            merge_endpoint_results_dict=merge_endpoint_results_dict,
+        )
+        try:
+            if self.REPAIR_GAPS:
+                self.repair_gaps(endpoint, extra_params, extra_tags, **kwargs)
+
+            # first finish whatever an interrupted sync left behind, then plan from what's in the db now
+            for plan in (self._load_checkpoint, self._plan_legs):
+                for start, end in self._iter_legs(plan()):
+                    self.do_fetch(
+                        self._time_steps(start, end), start, end, endpoint, extra_params, extra_tags, **kwargs
+                    )
+            self.resample_written()
+        finally:
+            self.metrics.export()
+
+    def resample_written(self):
+        """Rebuilds the RESAMPLE_INTERVALS buckets overlapping the candles this sync wrote, from the 1m candles in
+        the db (see candles/resample.py), rather than syncing those intervals from the exchange too.
+        """
+        if not self.RESAMPLE_INTERVALS or not self._written_ranges or self.data_type != "candles":
+            return
+        assert self.interval == Resampler.SOURCE_INTERVAL, f"Can only resample {Resampler.SOURCE_INTERVAL} candles"
+        resampler = Resampler(
+            self.EXCHANGE, self.symbol, series_filter=self._series_filter(), influx_client=self.influx_client
+        )
+        for interval in self.RESAMPLE_INTERVALS:
+            # a gap repaired far behind the latest candles is its own range, rather than everything in between
+            for start, end in merge_ranges(self._written_ranges, self._interval_to_seconds(interval)):
+                resampler.resample(interval, start, end)
+
+    def _plan_legs(self):
+        """Returns the [start, end] ranges to fetch, in order. Normally that's just the range after the latest candle
+        in the db. If the start is before the earliest candle in the db, the first fetch grabs start->earliest_in_db,
+        and a second one grabs latest_in_db->now (end=None, as "now" is only known once we get there).
+        """
+        _, start, end, fetch_again = self.get_iterations_for_range(self.API_MAX_RECORDS)
+        if start > end:
+            logger.debug(
+                f"Nothing to sync, as we have already have {arrow.get(start).isoformat()} in the database, "
+                f"and end date {arrow.get(end).isoformat()} was selected."
+            )
+            return []
+        logger.debug("Using the following time ranges to complete the sync: {} to {}".format(start, end))
+        legs = [[start, end]]
+        if fetch_again:
+            legs.append([fetch_again, None])
+        return legs
+
+    def _iter_legs(self, legs):
+        """Yields each (start, end) leg to fetch, checkpointing what's left (see _checkpoint()) as we go"""
+        self._pending_legs = legs
+        try:
+            while self._pending_legs:
+                start, end = self._pending_legs[0]
+                if end is None:
+                    logger.debug("Fetching again, this time from the latest in the db, to now()")
+                    end = self._pending_legs[0][1] = int(datetime.datetime.now().timestamp())
+                self._save_checkpoint()
+                yield start, end
+                self._pending_legs = self._pending_legs[1:]
+            self._save_checkpoint()
+        finally:
+            self._pending_legs = None
+
+    def _load_checkpoint(self):
+        """Returns the legs an interrupted sync of this series didn't get to, if any"""
+        if not self.sync_state:
+            return []
+        legs = self.sync_state.get_checkpoint(self._series_key()) or []
+        if legs:
+            logger.info(f"Resuming an interrupted sync of {self.symbol} at {legs[0][0]}: {legs}")
+        return legs
+
+    def _save_checkpoint(self):
+        if self.sync_state:
+            self.sync_state.set_checkpoint(self._series_key(), self._pending_legs)
+
+    def _checkpoint(self, done_through):
+        """Called as each window is written. Everything before done_through is in the db, so a resumed sync can
+        start there.
+        """
+        if self._pending_legs:
+            self._pending_legs[0][0] = max(self._pending_legs[0][0], done_through)
+            self._save_checkpoint()
 
+    def _default_range(self):
+        """Fills in start/end when they weren't given: end defaults to now, and start to DEFAULT_SYNC_DAYS ago"""
         if self.start and not self.end:
             self.end = int(datetime.datetime.now().timestamp())
 
@@ -246,23 +705,28 @@ class BaseSyncCandles(object):
             self.start = int((now - datetime.timedelta(days=self.DEFAULT_SYNC_DAYS)).timestamp())
             self.end = int(now.timestamp())
 
-        steps, start, end, fetch_again = self.get_iterations_for_range(self.API_MAX_RECORDS)
-        if start > end:
-            logger.debug(
-                f"Nothing to sync, as we have already have {arrow.get(start).isoformat()} in the database, "
-                f"and end date {arrow.get(end).isoformat()} was selected."
-            )
-            return
-        logger.debug("Using the following time ranges to complete the sync: {} to {}".format(start, end))
-
-        time_steps = list(self.timestamp_ranges(start, end, steps))
-        self.do_fetch(
-            time_steps,
-            start,
-            end,
-            endpoint,
-            extra_params,
-            extra_tags,
+    async def async_sync(
+        self,
+        endpoint,
+        extra_params={},
+        extra_tags=None,
+        start_format="start",
+        end_format="end",
+        timestamp_units="ms",
+        result_key=None,
+        reverse_order=False,
+        merge_endpoint_results_dict=False,
+    ):
+        """asyncio version of sync(). Exchange requests go through aiohttp and wait on the rate limiter without
+        blocking, so one event loop can drive many syncs at once. Influx queries and writes run in the default
+        executor.
+        """
+        assert not any(key in extra_params for key in ["limit", "start", "end"]), "Cannot"
+        " override the following params: limit, start, end"
+        self._default_range()
+        self._last_written = None  # the db may have changed since the last sync
+        self._written_ranges = []
+        kwargs = dict(
             start_format=start_format,
             end_format=end_format,
             timestamp_units=timestamp_units,
@@ -271,30 +735,117 @@ class BaseSyncCandles(object):
             merge_endpoint_results_dict=merge_endpoint_results_dict,
         )
 
-        # Date requested was before latest in the db, so the first fetch grabbed start->earliest_in_db,
-        # and this one will grab latests_in_db->now.
-        if fetch_again:
-            logger.debug("Fetching again, this time from the latest in the db, to now()")
-            self.start = fetch_again
-            self.end = int(datetime.datetime.now().timestamp())
-            steps, start, end, _ = self.get_iterations_for_range(self.API_MAX_RECORDS)
-            time_steps = list(self.timestamp_ranges(start, end, steps))
-            self.do_fetch(
-                time_steps,
+        try:
+            if self.REPAIR_GAPS:
+                for gap_start, gap_end in await self._run_blocking(self._gaps_to_repair):
+                    await self.async_do_fetch(
+                        self._time_steps(gap_start, gap_end),
+                        gap_start,
+                        gap_end,
+                        endpoint,
+                        extra_params,
+                        extra_tags,
+                        **kwargs,
+                    )
+                    await self._run_blocking(self._gap_repaired, gap_start, gap_end)
+
+            for plan in (self._load_checkpoint, self._plan_legs):
+                for start, end in self._iter_legs(await self._run_blocking(plan)):
+                    await self.async_do_fetch(
+                        self._time_steps(start, end), start, end, endpoint, extra_params, extra_tags, **kwargs
+                    )
+            await self._run_blocking(self.resample_written)
+        finally:
+            await self._run_blocking(self.metrics.export)
+
+    def do_fetch(
+        self,
+        time_steps,
+        start,
+        end,
+        endpoint,
+        extra_params,
+        extra_tags,
+        start_format="start",
+        end_format="end",
+        timestamp_units="ms",
+        result_key=None,
+        reverse_order=False,
+        merge_endpoint_results_dict=False,
+    ):
+        windows = list(zip(time_steps, time_steps[1:]))
+
+        def _fetch(start, end):
+            return self._fetch_window(
                 start,
                 end,
                 endpoint,
                 extra_params,
-                extra_tags,
                 start_format=start_format,
                 end_format=end_format,
                 timestamp_units=timestamp_units,
                 result_key=result_key,
-                reverse_order=False,
+                reverse_order=reverse_order,
                 merge_endpoint_results_dict=merge_endpoint_results_dict,
             )
 
-    def do_fetch(
+        if self.PAGINATION == "cursor" and self.data_type == "candles":
+            # with a response cache, page through each grid window on its own, so requests repeat between syncs
+            ranges = windows if self.response_cache else [(start, end)]
+            pages = (page for window in ranges for page in self._cursor_pages(*window, _fetch))
+        else:
+            pages = self._fetch_windows(windows, _fetch)
+        self._pipeline(pages, lambda page: self._write_page(page, extra_tags, timestamp_units))
+
+    def _write_page(self, page, extra_tags, timestamp_units):
+        """Writes a (done_through, results) page, and checkpoints the progress"""
+        done_through, res_formatted = page
+        with self.metrics.timer("write_latency_seconds"):
+            self.write_candles(res_formatted, extra_tags, timestamp_units)
+        self.metrics.count("rows_written", len(res_formatted))
+        self.metrics.count("windows_completed")
+        self._checkpoint(done_through)
+
+    def _pipeline(self, pages, write):
+        """Calls write(page) for each fetched page on a background thread, so influx writes overlap with the next
+        exchange requests. At most WRITE_QUEUE_SIZE pages wait between the two stages, which keeps memory flat no
+        matter how long the range is. Pages are written in order, and the first error from either stage is raised.
+        """
+        if not self.WRITE_QUEUE_SIZE:
+            for page in pages:
+                write(page)
+            return
+
+        pending = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        errors = []
+
+        def _writer():
+            while True:
+                page = pending.get()
+                if page is _DONE:
+                    return
+                if errors:
+                    continue  # keep draining, so the fetching side never blocks on a full queue
+                try:
+                    write(page)
+                except Exception as err:
+                    errors.append(err)
+
+        writer = threading.Thread(target=_writer, name=f"{self.EXCHANGE}-{self.symbol}-writer", daemon=True)
+        writer.start()
+        try:
+            for page in pages:
+                if errors:
+                    break
+                pending.put(page)
+        finally:
+            pages.close()
+            pending.put(_DONE)
+            writer.join()
+        if errors:
+            raise errors[0]
+
+    async def async_do_fetch(
         self,
         time_steps,
         start,
@@ -309,65 +860,268 @@ class BaseSyncCandles(object):
         reverse_order=False,
         merge_endpoint_results_dict=False,
     ):
-        for start, end in zip(time_steps, time_steps[1:]):
-            formatted_start = start  # formatted for exchange API calls
-            formatted_end = end
-            if timestamp_units == "ms":
-                formatted_start *= 1_000
-                formatted_end *= 1_000
-            elif timestamp_units == "us":
-                formatted_start *= 1_000_000
-                formatted_end *= 1_000_000
-            params = {
-                "limit": self.API_MAX_RECORDS,
-                start_format: int(formatted_start),
-                end_format: int(formatted_end),
-            }
-            if not self.API_MAX_RECORDS:
-                del params["limit"]  # some exchanges don't support this param
-
-            if extra_params:
-                params.update(extra_params)
+        """asyncio version of do_fetch(). Up to API_CONCURRENCY windows are requested while the previous ones are
+        written to influx, in timestamp order.
+        """
+        windows = list(zip(time_steps, time_steps[1:]))
 
-            logger.debug(
-                "Pulling {} from {} for {} from {} to {}".format(
-                    endpoint,
-                    self.EXCHANGE,
-                    self.symbol,
-                    arrow.get(start).format("YYYY-MM-DD HH:mm:ss"),
-                    arrow.get(end).format("YYYY-MM-DD HH:mm:ss"),
-                )
+        async def _fetch(start, end):
+            return await self._async_fetch_window(
+                start,
+                end,
+                endpoint,
+                extra_params,
+                start_format=start_format,
+                end_format=end_format,
+                timestamp_units=timestamp_units,
+                result_key=result_key,
+                reverse_order=reverse_order,
+                merge_endpoint_results_dict=merge_endpoint_results_dict,
             )
 
-            if not isinstance(endpoint, list):
-                endpoint = [endpoint]
+        if self.PAGINATION == "cursor" and self.data_type == "candles":
+            ranges = windows if self.response_cache else [(start, end)]
+            pages = (page for window in ranges async for page in self._async_cursor_pages(*window, _fetch))
+        else:
+            pages = self._async_fetch_windows(windows, _fetch)
+        async for page in pages:
+            await self._run_blocking(self._write_page, page, extra_tags, timestamp_units)
+
+    async def _async_fetch_windows(self, windows, fetch):
+        """asyncio version of _fetch_windows()"""
+        in_flight = deque()
+        try:
+            for start, end in windows:
+                in_flight.append((end, asyncio.ensure_future(fetch(start, end))))
+                if len(in_flight) >= self.API_CONCURRENCY:
+                    end, task = in_flight.popleft()
+                    yield end, await task
+            while in_flight:
+                end, task = in_flight.popleft()
+                yield end, await task
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+
+    async def _async_cursor_pages(self, start, end, fetch):
+        """asyncio version of _cursor_pages()"""
+        cursor = start
+        while cursor is not None and cursor < end:
+            page = await fetch(cursor, end)
+            cursor = self._next_cursor(cursor, page)
+            yield cursor or end, page
+
+    def _fetch_windows(self, windows, fetch):
+        """Yields (end, fetch(start, end)) for each (start, end) window, in timestamp order.
+        With API_CONCURRENCY > 1, up to that many windows are requested at once by a worker pool, so that we're not
+        waiting on each request (and influx write) before starting the next one. Only API_CONCURRENCY results are
+        ever held in memory.
+        """
+        if self.API_CONCURRENCY <= 1 or len(windows) <= 1:
+            for start, end in windows:
+                yield end, fetch(start, end)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.API_CONCURRENCY) as pool:
+            in_flight = deque()
+            for start, end in windows:
+                in_flight.append((end, pool.submit(fetch, start, end)))
+                if len(in_flight) >= self.API_CONCURRENCY:
+                    end, future = in_flight.popleft()
+                    yield end, future.result()
+            while in_flight:
+                end, future = in_flight.popleft()
+                yield end, future.result()
+
+    def _cursor_pages(self, start, end, fetch):
+        """Yields (done_through, fetch(cursor, end)) pages, moving the cursor to the last candle actually returned (less
+        CURSOR_OVERLAP candles), until the exchange returns less than a full page. So the number of requests follows
+        the data that exists, rather than assuming every bin in the range has a candle.
+        Needs the exchange to return candles oldest first.
+        """
+        cursor = start
+        while cursor is not None and cursor < end:
+            page = fetch(cursor, end)
+            cursor = self._next_cursor(cursor, page)
+            yield cursor or end, page
+
+    def _next_cursor(self, cursor, page):
+        """Returns where the request after `page` should start, or None if page was the last one"""
+        if not self.API_MAX_RECORDS or len(page) < self.API_MAX_RECORDS:
+            return None
+        return max(page.ts[-1] // 1_000 - self.CURSOR_OVERLAP * self._interval_to_seconds(self.interval), cursor + 1)
+
+    def _fetch_window(
+        self,
+        start,
+        end,
+        endpoint,
+        extra_params,
+        start_format="start",
+        end_format="end",
+        timestamp_units="ms",
+        result_key=None,
+        reverse_order=False,
+        merge_endpoint_results_dict=False,
+    ):
+        """Pulls a single (start, end) window from the exchange, and returns the results ready for write_candles()"""
+        cache_window = self._response_cache_window(start, end)
+        fetch_start, fetch_end = cache_window or (start, end)
+        params = self._window_params(
+            fetch_start, fetch_end, endpoint, extra_params, start_format, end_format, timestamp_units
+        )
+        results = [
+            self._cached_call_api(api_endpoint, params, fetch_start, fetch_end)
+            for api_endpoint in self._endpoints(endpoint)
+        ]
+        res = self._format_results(results, timestamp_units, result_key, reverse_order, merge_endpoint_results_dict)
+        return self._trim_batch(res, start, end, timestamp_units) if cache_window else res
+
+    async def _async_fetch_window(
+        self,
+        start,
+        end,
+        endpoint,
+        extra_params,
+        start_format="start",
+        end_format="end",
+        timestamp_units="ms",
+        result_key=None,
+        reverse_order=False,
+        merge_endpoint_results_dict=False,
+    ):
+        """asyncio version of _fetch_window()"""
+        cache_window = self._response_cache_window(start, end)
+        fetch_start, fetch_end = cache_window or (start, end)
+        params = self._window_params(
+            fetch_start, fetch_end, endpoint, extra_params, start_format, end_format, timestamp_units
+        )
+        results = [
+            await self._async_cached_call_api(api_endpoint, params, fetch_start, fetch_end)
+            for api_endpoint in self._endpoints(endpoint)
+        ]
+        res = self._format_results(results, timestamp_units, result_key, reverse_order, merge_endpoint_results_dict)
+        return self._trim_batch(res, start, end, timestamp_units) if cache_window else res
+
+    def _response_cache_window(self, start, end):
+        """Returns the (start, end) window of the API_MAX_RECORDS candles grid that start->end falls in, if its
+        response can be cached: a cache is configured, and the window closed RESPONSE_CACHE_SETTLE_SECS ago.
+        That whole window is requested instead, and the candles outside start->end dropped (see _trim_batch()), so
+        the same requests come up whatever range a sync covers. None otherwise.
+        """
+        if not self.response_cache or not self.API_MAX_RECORDS or self.data_type != "candles":
+            return None
+        size = self.API_MAX_RECORDS * self._interval_to_seconds(self.interval)
+        window_start = start - start % size
+        window_end = window_start + size
+        if end > window_end or window_end > datetime.datetime.now().timestamp() - self.RESPONSE_CACHE_SETTLE_SECS:
+            return None
+        return window_start, window_end
+
+    @staticmethod
+    def _trim_batch(batch, start, end, timestamp_units):
+        """Returns the batch without the candles outside [start, end] (s)"""
+        scale = 1_000_000 if timestamp_units == "us" else 1_000  # batches are in ms, unless the exchange uses us
+        outside = [i for i, ts in enumerate(batch.ts) if not start * scale <= ts <= end * scale]
+        return batch.drop(outside) if outside else batch
+
+    def _cache_key(self, endpoint, params, start, end):
+        """Returns the response cache key for a window request, or None if it shouldn't be cached: no cache is
+        configured, or the window isn't one of _response_cache_window()'s.
+        """
+        if self._response_cache_window(start, end) != (start, end):
+            return None
+        return self.response_cache.key(self.EXCHANGE, endpoint, params)
+
+    def _cached_call_api(self, endpoint, params, start, end):
+        """call_api(), served from the response cache for windows that have closed (see CANDLES_RESPONSE_CACHE_DIR)"""
+        key = self._cache_key(endpoint, params, start, end)
+        if not key:
+            return self.call_api(endpoint, params)
+        response = self.response_cache.get(key)
+        if response is None:
+            response = self.call_api(endpoint, params)
+            self.response_cache.put(key, response)
+        return response
+
+    async def _async_cached_call_api(self, endpoint, params, start, end):
+        """asyncio version of _cached_call_api(). Cache files are read and written off the event loop."""
+        key = self._cache_key(endpoint, params, start, end)
+        if not key:
+            return await self.async_call_api(endpoint, params)
+        response = await self._run_blocking(self.response_cache.get, key)
+        if response is None:
+            response = await self.async_call_api(endpoint, params)
+            await self._run_blocking(self.response_cache.put, key, response)
+        return response
+
+    @staticmethod
+    def _endpoints(endpoint):
+        return endpoint if isinstance(endpoint, list) else [endpoint]
+
+    def _window_params(self, start, end, endpoint, extra_params, start_format, end_format, timestamp_units):
+        """Returns the exchange request params for a (start, end) window"""
+        formatted_start = start  # formatted for exchange API calls
+        formatted_end = end
+        if timestamp_units == "ms":
+            formatted_start *= 1_000
+            formatted_end *= 1_000
+        elif timestamp_units == "us":
+            formatted_start *= 1_000_000
+            formatted_end *= 1_000_000
+        params = {
+            "limit": self.API_MAX_RECORDS,
+            start_format: int(formatted_start),
+            end_format: int(formatted_end),
+        }
+        if not self.API_MAX_RECORDS:
+            del params["limit"]  # some exchanges don't support this param
+
+        if extra_params:
+            params.update(extra_params)
+
+        # lazy, so nothing is formatted per window unless debug logging is on
+        logger.opt(lazy=True).debug(
+            "Pulling {} from {} for {} from {} to {}",
+            lambda: endpoint,
+            lambda: self.EXCHANGE,
+            lambda: self.symbol,
+            lambda: _isoformat(start),
+            lambda: _isoformat(end),
+        )
+        return params
+
+    def _format_results(self, results, timestamp_units, result_key, reverse_order, merge_endpoint_results_dict):
+        """Combines the responses of every endpoint for a window, ready for write_candles()"""
+        if merge_endpoint_results_dict:
+            res_formatted = dict()  # we expect a single dict per endpoint
+        else:
+            res_formatted = list()  # normal case: lists are returned
+        for res in results:
+            if result_key:
+                res = res[result_key]
+            if reverse_order:
+                res.reverse()
             if merge_endpoint_results_dict:
-                res_formatted = dict()  # we expect a single dict per endpoint
+                res_formatted = res | res_formatted
             else:
-                res_formatted = list()  # normal case: lists are returned
-            for api_endpoint in endpoint:
-                res = self.call_api(api_endpoint, params)
-                if result_key:
-                    res = res[result_key]
-                if reverse_order:
-                    res.reverse()
-                if merge_endpoint_results_dict:
-                    res_formatted = res | res_formatted
-                else:
-                    res_formatted += res  # for list use cases
-            if not isinstance(res_formatted, list):
-                res_formatted = [res_formatted]
-            self.write_candles(res_formatted, extra_tags, timestamp_units)
+                self.metrics.observe("rows_per_response", len(res))
+                res_formatted += res  # for list use cases
+        if not isinstance(res_formatted, list):
+            res_formatted = [res_formatted]
+        if self.data_type == "candles":
+            return self.to_candle_batch(res_formatted, timestamp_units)  # converted once per response
+        return res_formatted
 
     def _interval_to_seconds(self, period: str) -> int:
         """Converts standard 1m, 1h, 7d interval strings to seconds, as some exchanges require that."""
 
-        if self.interval.endswith("m"):
-            period = 60 * int(self.interval.rstrip("m"))
-        elif self.interval.endswith("h"):
-            period = 60 * 60 * int(self.interval.rstrip("h"))
-        elif self.interval.endswith("d"):
-            period = 60 * 60 * 24 * int(self.interval.rstrip("d"))
+        if period.endswith("m"):
+            period = 60 * int(period.rstrip("m"))
+        elif period.endswith("h"):
+            period = 60 * 60 * int(period.rstrip("h"))
+        elif period.endswith("d"):
+            period = 60 * 60 * 24 * int(period.rstrip("d"))
         return period
 
 
@@ -377,7 +1131,17 @@ class SyncSFOXCandles(BaseSyncCandles):
     DEFAULT_SYNC_DAYS = 90
     API_MAX_RECORDS = 1_000
     API_CALLS_PER_MIN = 100_000 if IS_PYTEST else 1200
+    API_BASE_URL = "https://chartdata.sfox.com/"
     EXCHANGE = "sfox"
+    STRING_FIELDS = True  # SFOX returns strings, which is what its candles were always stored as
+    candle_dict_keys = {
+        "ts": "start_time",
+        "open": "open_price",
+        "high": "high_price",
+        "low": "low_price",
+        "close": "close_price",
+        "volume": "volume",
+    }
 
     def api_client(self):
         if not self.client:
@@ -385,26 +1149,15 @@ class SyncSFOXCandles(BaseSyncCandles):
             self.client = SFOXApi()
         return self.client
 
-    @sleep_and_retry
-    @limits(calls=API_CALLS_PER_MIN, period=60)  # calls per minute
-    def call_api(self, endpoint, params):
-        """Binance specific rate limits and brequest"""
+    def api_request(self, endpoint, params):
+        """SFOX specific brequest"""
         return self.client.brequest(endpoint=endpoint, params=params)
 
-    def pull_data(self):
-        self.candle_dict_keys = {
-            "ts": "start_time",
-            "open": "open_price",
-            "high": "high_price",
-            "low": "low_price",
-            "close": "close_price",
-            "volume": "volume",
-        }
+    def sync_args(self):
         endpoint = "candlesticks"
         period = self._interval_to_seconds(self.interval)
 
-        self.sync(
-            endpoint,
+        return endpoint, dict(
             extra_params={"period": period, "pair": self.symbol},
             start_format="startTime",
             end_format="endTime",
@@ -417,8 +1170,23 @@ class SyncBinanceCandles(BaseSyncCandles):
 
     DEFAULT_SYNC_DAYS = 90
     API_MAX_RECORDS = 10_000
-    API_CALLS_PER_MIN = 100_000 if IS_PYTEST else 1200
+    API_CALLS_PER_MIN = 100_000 if IS_PYTEST else 1200  # request weight, not calls
+    API_WEIGHTS = {"klines": 2}
+    API_CONCURRENCY = 4
+    # 418 is the IP ban for ignoring 429s. Both come with a Retry-After.
+    RETRYABLE_STATUS_CODES = {408, 418, 429, 500, 502, 503, 504}
+    RATE_LIMITED_STATUS_CODES = {418, 429}
+    API_BASE_URL = "https://api.binance.com/api/v3/"
+    STREAM_URL = "wss://stream.binance.com:9443/ws/{symbol}@kline_{interval}"
     EXCHANGE = "binance"
+    candle_order = {
+        "ts": 0,
+        "open": 1,
+        "high": 2,
+        "low": 3,
+        "close": 4,
+        "volume": 5,
+    }
 
     def api_client(self):
         if not self.client:
@@ -426,29 +1194,25 @@ class SyncBinanceCandles(BaseSyncCandles):
             self.client = BinanceApi()
         return self.client
 
-    @sleep_and_retry
-    @limits(calls=API_CALLS_PER_MIN, period=60)  # calls per minute
-    def call_api(self, endpoint, params):
-        """Binance specific rate limits and brequest"""
+    def api_request(self, endpoint, params):
+        """Binance specific brequest"""
         return self.client.brequest(api_version=3, endpoint=endpoint, params=params)
 
-    def pull_data(self):
-        self.candle_order = {
-            "ts": 0,
-            "open": 1,
-            "high": 2,
-            "low": 3,
-            "close": 4,
-            "volume": 5,
-        }
+    def sync_args(self):
         endpoint = "klines"
-        self.sync(
-            endpoint,
+        return endpoint, dict(
             extra_params={"interval": self.interval, "symbol": self.symbol},
             start_format="startTime",
             end_format="endTime",
         )
 
+    def parse_stream_message(self, message):
+        """Kline stream events: k.x is set on the last update of a candle, once it's closed"""
+        kline = message.get("k")
+        if not kline or not kline["x"]:
+            return None
+        return [kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"]]
+
 
 class SyncBitfinexCandles(BaseSyncCandles):
     """Sync candles for Bitfinex"""
@@ -456,8 +1220,24 @@ class SyncBitfinexCandles(BaseSyncCandles):
     DEFAULT_SYNC_DAYS = 90
     API_MAX_RECORDS = 10_000
     API_CALLS_PER_MIN = 100_000 if IS_PYTEST else 90
+    # Bitfinex answers bad requests with a 500 too, so only retry the gateway errors
+    RETRYABLE_STATUS_CODES = {408, 429, 502, 503, 504}
+    RATE_LIMIT_PENALTY = 60  # Bitfinex blocks the IP for 60s once the limit is hit, and sends no Retry-After
+    API_BASE_URL = "https://api-pub.bitfinex.com/v2/"
     EXCHANGE = "bitfinex"
+    candle_order = {
+        "ts": 0,
+        "open": 1,
+        "close": 2,
+        "high": 3,
+        "low": 4,
+        "volume": 5,
+    }
     PERIODS = [f"p{n}" for n in range(2, 31)]
+    PAGINATION = "cursor"  # plenty of sparse markets, and we always ask for sort=1 (oldest first)
+    FUNDING_PERIOD_CONCURRENCY = 8  # funding periods synced at once, all sharing the exchange rate limit
+    _coverage = None  # (earliest, latest) pre-fetched by pull_data_funding()
+    _latest_candle = None  # and the latest candle, see _query_latest_candle()
 
     def api_client(self):
         if not self.client:
@@ -465,8 +1245,12 @@ class SyncBitfinexCandles(BaseSyncCandles):
             self.client = BitfinexApi()
         return self.client
 
-    def get_earliest_latest_timestamps_in_db(self):
+    def _query_earliest_latest(self):
         """Overriding base class, as we need to include the period for bitfinex lending data)"""
+        if self._coverage is not None:  # only valid before we've written anything
+            coverage, self._coverage = self._coverage, None
+            return coverage
+
         query = "SELECT open,time FROM candles_{} WHERE symbol='{}'".format(self.interval, self.symbol)
 
         if self.symbol.startswith("f"):
@@ -482,51 +1266,102 @@ class SyncBitfinexCandles(BaseSyncCandles):
             latest = self.influx_client.query(query + " ORDER BY time DESC LIMIT 1")
             earliest = self.influx_client.query(query + " ORDER BY time ASC LIMIT 1")
 
-        earliest = arrow.get(list(earliest)[0][0]["time"] / 1_000).int_timestamp if earliest else 0
-        latest = arrow.get(list(latest)[0][0]["time"] / 1_000).int_timestamp if latest else 0
+        earliest = list(earliest)[0][0]["time"] // 1_000 if earliest else 0
+        latest = list(latest)[0][0]["time"] // 1_000 if latest else 0
         return earliest, latest
 
-    @sleep_and_retry
-    @limits(calls=API_CALLS_PER_MIN, period=60)  # calls per minute
-    def call_api(self, endpoint, params):
-        """Bitfinex specific rate limits and brequest"""
+    def _query_latest_candle(self):
+        """Overriding base class, to use the latest funding candle pre-fetched with the coverage"""
+        if self._latest_candle is not None:
+            latest, self._latest_candle = self._latest_candle, None
+            return latest
+        return super()._query_latest_candle()
+
+    def _series_filter(self):
+        """Overriding base class, as funding candles are split into one series per period"""
+        where, params = super()._series_filter()
+        if self.symbol.startswith("f"):
+            where += " AND period=$period"
+            params["period"] = str(self.cur_period)
+        return where, params
+
+    def api_request(self, endpoint, params):
+        """Bitfinex specific brequest"""
         return self.client.brequest(api_version=2, endpoint=endpoint, params=params)
 
+    def sync_args(self):
+        """Trading candles. Funding candles are one series per period, see _period_sync()"""
+        assert self.symbol.startswith("t"), "Bitfinex trading symbols must start with 't'"
+
+        endpoint = "candles/trade:{interval}:{symbol}/hist".format(interval=self.interval, symbol=self.symbol)
+        return endpoint, dict(extra_params={"sort": 1})  # get oldest candles first
+
     def pull_data(self):
-        self.candle_order = {
-            "ts": 0,
-            "open": 1,
-            "close": 2,
-            "high": 3,
-            "low": 4,
-            "volume": 5,
-        }
         if self.symbol.startswith("f"):
             return self.pull_data_funding()
         else:
             return self.pull_data_trading()
 
-    def pull_data_trading(self):
-        assert self.symbol.startswith("t"), "Bitfinex trading symbols must start with 't'"
+    async def async_pull_data(self):
+        if not self.symbol.startswith("f"):
+            return await super().async_pull_data()
 
-        endpoint = "candles/trade:{interval}:{symbol}/hist".format(interval=self.interval, symbol=self.symbol)
-        self.sync(endpoint, extra_params={"sort": 1})  # get oldest candles first
+        async with self._async_session():
+            coverage = await self._run_blocking(self._query_funding_coverage)
+            syncs = [self._period_sync(period, coverage) for period in self.PERIODS]
+            await asyncio.gather(*(client.async_sync(endpoint, **kwargs) for client, endpoint, kwargs in syncs))
+        return True
+
+    def pull_data_trading(self):
+        super().pull_data()
         return True
 
     def pull_data_funding(self):
         assert self.symbol.startswith("f"), "Bitfinex funding symbols must start with 'f'"
 
-        extra_tags = {}
-        self.cur_period = ""
-
         logger.info("Syncing candles for {} for {}".format(self.EXCHANGE, self.symbol))
+        coverage = self._query_funding_coverage()
 
-        for period in self.PERIODS:
-            self.cur_period = period  # used in get_earliest_latest_timestamps_in_db()
-            extra_tags["period"] = period
-            endpoint = "candles/trade:{interval}:{symbol}:{period}/hist".format(
-                interval=self.interval, symbol=self.symbol, period=period
-            )
+        def _sync_period(period):
+            client, endpoint, kwargs = self._period_sync(period, coverage)
+            client.sync(endpoint, **kwargs)
 
-            self.sync(endpoint, extra_tags=extra_tags)
+        with ThreadPoolExecutor(max_workers=self.FUNDING_PERIOD_CONCURRENCY) as pool:
+            list(pool.map(_sync_period, self.PERIODS))
         return True
+
+    def _period_sync(self, period, coverage):
+        """Returns (client, endpoint, sync kwargs) for a funding period. Periods are independent series, so each
+        gets its own copy of this instance (sharing the clients and rate limiter).
+        """
+        client = copy.copy(self)
+        client.cur_period = period  # used in get_earliest_latest_timestamps_in_db()
+        client._coverage, client._latest_candle = coverage.get(period, ((0, 0), {}))
+        endpoint = "candles/trade:{interval}:{symbol}:{period}/hist".format(
+            interval=self.interval, symbol=self.symbol, period=period
+        )
+        return client, endpoint, dict(extra_params={"sort": 1}, extra_tags={"period": period})  # oldest first
+
+    def _query_funding_coverage(self):
+        """Returns {period: ((earliest, latest), latest_candle)} for every funding period in the db, from a single
+        round trip rather than three queries per period. latest_candle is as _query_latest_candle() returns it.
+        """
+        query = f"SELECT {{}} FROM candles_{self.interval} WHERE symbol=$symbol GROUP BY period"
+        earliest, latest = self.influx_client.query(
+            "; ".join([query.format("FIRST(open)"), query.format("LAST(open), high, low, close, volume")]),
+            bind_params={"symbol": self.symbol},
+        )
+        # NOTE: all candles are stored in influx as ms
+        earliest = {tags["period"]: next(points)["time"] for (_, tags), points in earliest.items()}
+        latest = {tags["period"]: next(points) for (_, tags), points in latest.items()}
+
+        coverage = {}
+        for period in earliest.keys() | latest.keys():  # either statement can come back without a period
+            last = latest.get(period)
+            first = earliest.get(period, last and last["time"])
+            if not last:
+                coverage[period] = ((first // 1_000, first // 1_000), {})
+                continue
+            candle = {last["time"]: (last["last"], last["high"], last["low"], last["close"], last["volume"])}
+            coverage[period] = ((first // 1_000, last["time"] // 1_000), candle)
+        return coverage
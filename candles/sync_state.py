@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class SyncStateStore(object):
+    """Local SQLite store for sync bookkeeping, so we don't have to ask influx on every run.
+
+    Watermarks are the earliest/latest candle timestamps (in seconds) per series, where a series is
+    (exchange, interval, data_type, series), and series is the tag filter string, i.e. "period=p2,symbol=fUSD".
+    A row with NULL earliest/latest means the series is known to be empty. Rows flagged as suspect are ignored
+    until they're refreshed from influx.
+
+    Next to the watermarks, we keep the values of the latest candles written to each series, so syncs can tell
+    whether the candles they refetch changed without querying influx. They're only trusted along with the watermarks.
+
+    Repaired gaps are the [start, end) ranges gap repair already refetched. Whatever is still missing there, the
+    exchange doesn't have either, so they aren't refetched on every run.
+
+    Checkpoints are the [start, end] ranges a sync still has to fetch for a series, updated as each window is
+    written, so an interrupted sync resumes at its first unfinished window. end is None for "up to now".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # autocommit, so every statement is its own transaction and other processes see it straight away
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " exchange TEXT, interval TEXT, data_type TEXT, series TEXT,"
+            " earliest INTEGER, latest INTEGER, suspect INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (exchange, interval, data_type, series))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS latest_candles ("
+            " exchange TEXT, interval TEXT, data_type TEXT, series TEXT, candles TEXT NOT NULL,"
+            " PRIMARY KEY (exchange, interval, data_type, series))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS repaired_gaps ("
+            " exchange TEXT, interval TEXT, data_type TEXT, series TEXT, gap_start INTEGER, gap_end INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " exchange TEXT, interval TEXT, data_type TEXT, series TEXT, legs TEXT NOT NULL,"
+            " PRIMARY KEY (exchange, interval, data_type, series))"
+        )
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def get_watermarks(self, key):
+        """Returns (earliest, latest) for the series, with 0s for a known empty series. None if there's no trusted
+        entry, in which case the caller should ask influx, and save the answer with set_watermarks().
+        """
+        rows = self._execute(
+            "SELECT earliest, latest FROM watermarks WHERE exchange=? AND interval=? AND data_type=? AND series=?"
+            " AND suspect=0",
+            key,
+        )
+        if not rows:
+            return None
+        earliest, latest = rows[0]
+        return earliest or 0, latest or 0
+
+    def set_watermarks(self, key, earliest, latest):
+        """Saves what influx told us, clearing any suspect flag, and the latest candles saved before it"""
+        self._execute(
+            "INSERT OR REPLACE INTO watermarks (exchange, interval, data_type, series, earliest, latest, suspect)"
+            " VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (*key, earliest or None, latest or None),
+        )
+        self._execute("DELETE FROM latest_candles WHERE exchange=? AND interval=? AND data_type=? AND series=?", key)
+
+    def extend_watermarks(self, key, earliest, latest):
+        """Widens the watermarks after a successful write. Series we don't have an entry for are left alone, as
+        we can't know what else is already in influx for them.
+        """
+        self._execute(
+            "UPDATE watermarks SET earliest=MIN(COALESCE(earliest, ?), ?), latest=MAX(COALESCE(latest, ?), ?)"
+            " WHERE exchange=? AND interval=? AND data_type=? AND series=?",
+            (earliest, earliest, latest, latest, *key),
+        )
+
+    def get_latest_candles(self, key):
+        """Returns {ts (ms): (open, high, low, close, volume)} for the latest candles written to the series, {} for a
+        known empty series. None if the watermarks aren't trusted, or nothing was saved since they were read.
+        """
+        rows = self._execute(
+            "SELECT w.latest, c.candles FROM watermarks w LEFT JOIN latest_candles c"
+            " USING (exchange, interval, data_type, series)"
+            " WHERE exchange=? AND interval=? AND data_type=? AND series=? AND w.suspect=0",
+            key,
+        )
+        if not rows:
+            return None
+        latest, candles = rows[0]
+        if candles is None:
+            return None if latest else {}
+        return {row[0]: tuple(row[1:]) for row in json.loads(candles)}
+
+    def set_latest_candles(self, key, candles):
+        """Saves {ts (ms): (open, high, low, close, volume)}, as written to the series"""
+        self._execute(
+            "INSERT OR REPLACE INTO latest_candles (exchange, interval, data_type, series, candles)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (*key, json.dumps([[ts, *values] for ts, values in sorted(candles.items())])),
+        )
+
+    def get_repaired_gaps(self, key):
+        """Returns the [(start, end), ...] gap ranges already refetched for the series, oldest first"""
+        rows = self._execute(
+            "SELECT gap_start, gap_end FROM repaired_gaps WHERE exchange=? AND interval=? AND data_type=? AND series=?"
+            " ORDER BY gap_start",
+            key,
+        )
+        return [tuple(row) for row in rows]
+
+    def add_repaired_gap(self, key, start, end):
+        self._execute(
+            "INSERT INTO repaired_gaps (exchange, interval, data_type, series, gap_start, gap_end)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, start, end),
+        )
+
+    def get_checkpoint(self, key):
+        """Returns the [[start, end], ...] ranges an interrupted sync didn't finish, or None"""
+        rows = self._execute(
+            "SELECT legs FROM checkpoints WHERE exchange=? AND interval=? AND data_type=? AND series=?", key
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_checkpoint(self, key, legs):
+        """Saves the ranges still to be fetched. Clears the checkpoint once there are none left."""
+        if not legs:
+            return self.clear_checkpoint(key)
+        self._execute(
+            "INSERT OR REPLACE INTO checkpoints (exchange, interval, data_type, series, legs) VALUES (?, ?, ?, ?, ?)",
+            (*key, json.dumps(legs)),
+        )
+
+    def clear_checkpoint(self, key):
+        self._execute("DELETE FROM checkpoints WHERE exchange=? AND interval=? AND data_type=? AND series=?", key)
+
+    def mark_suspect(self, exchange=None, symbol=None):
+        """Flags entries to be re-read from influx, i.e. after deleting data there, and forgets the gaps repaired
+        so they're scanned again. Everything, if no filters.
+        """
+        where, params = "1=1", []
+        if exchange:
+            where += " AND exchange=?"
+            params.append(exchange)
+        if symbol:
+            where += " AND (',' || series || ',') LIKE ?"
+            params.append(f"%,symbol={symbol},%")
+        self._execute(f"UPDATE watermarks SET suspect=1 WHERE {where}", params)
+        self._execute(f"DELETE FROM repaired_gaps WHERE {where}", params)
+
+
+def get_sync_state():
+    """Returns the SyncStateStore at CANDLES_SYNC_STATE_DB, or None if it isn't set (so influx is always asked)"""
+    path = os.getenv("CANDLES_SYNC_STATE_DB")
+    if not path:
+        return None
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = SyncStateStore(path)
+        return _stores[path]
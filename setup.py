@@ -6,11 +6,11 @@ setup(
     description="Library and CLI for syncing crypto exchange data (candles, etc) to influxdb",
     packages=find_packages(),
     install_requires=[
+        "aiohttp",
         "arrow",
         "boto3",
         "influxdb",
         "loguru",
-        "ratelimit",
         "requests",
         "tardis-client",
         "tardis-dev",
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
+import asyncio
 import os
 
 from futures.sync_futures import get_sync_futures_class
 from loguru import logger
+import arrow
 import click
 
+from candles.resample import Resampler
+from candles.stream import CandleStream
 from candles.sync_candles import get_sync_candles_class
 from tardis import SyncHistorical
 
-COMMANDS = ["candles", "futures", "historical_futures"]
+COMMANDS = ["candles", "futures", "historical_futures", "resample", "stream"]
 logger.level = os.getenv("LOG_LEVEL", "WARNING")
 
 
@@ -24,6 +28,14 @@ logger.level = os.getenv("LOG_LEVEL", "WARNING")
 @click.option("--interval", type=str, default="1m", help="1m for 1m candle data")
 @click.option("--start", type=str, default=None, help="any string python-arrow supports")
 @click.option("--end", type=str, default=None, help="any string python-arrow supports")
+@click.option(
+    "--repair-gaps",
+    is_flag=True,
+    default=False,
+    help="also refetch holes in the existing candle data. Without CANDLES_SYNC_STATE_DB, holes the exchange has no "
+    "candles for (i.e. quiet hours on sparse markets) are refetched on every run",
+)
+@click.option("--resample", type=str, default="", help="i.e. 5m,1h,4h: also rebuild these from the 1m candles synced")
 def run(*args, **options):  # pragma: no cover
     if options["command"] == "candles":
         exchange = options["exchange"].lower()
@@ -34,8 +46,24 @@ def run(*args, **options):  # pragma: no cover
             start=options["start"],
             end=options["end"],
         )
+        client.REPAIR_GAPS = options["repair_gaps"]
+        client.RESAMPLE_INTERVALS = [i for i in options["resample"].split(",") if i]
         client.pull_data()
 
+    elif options["command"] == "stream":
+        # runs until killed: live candles from the exchange's push feed, backfilled over REST on every (re)connect
+        client = get_sync_candles_class(
+            exchange=options["exchange"].lower(), symbol=options["symbol"], interval=options["interval"]
+        )
+        asyncio.run(CandleStream(client).run())
+
+    elif options["command"] == "resample":
+        # rebuild candles_<interval> from the 1m candles in the db, i.e. for a new interval or after a --repair-gaps
+        resampler = Resampler(options["exchange"].lower(), options["symbol"])
+        start = arrow.get(options["start"]).int_timestamp if options["start"] else None
+        end = arrow.get(options["end"]).int_timestamp if options["end"] else None
+        resampler.resample(options["interval"], start, end)
+
     elif options["command"] == "futures":
         exchange = options["exchange"].lower()
         futures_client = get_sync_futures_class(
@@ -4,7 +4,7 @@ from loguru import logger
 from tardis_client import Channel, TardisClient
 import arrow
 
-from candles.sync_candles import BaseSyncCandles
+from candles.sync_candles import BaseSyncCandles, epoch_seconds
 from utils import get_aws_secret
 
 
@@ -61,12 +61,13 @@ class SyncHistorical(BaseSyncCandles):
             # FTX documents it
 
             # do we have this timestamp already? Only changes hourly, but they have more (duplicate) data.
-            time = {"time": arrow.get(message["data"]["stats"]["nextFundingTime"]).timestamp}
+            next_funding = message["data"]["stats"]["nextFundingTime"]
+            time = {"time": epoch_seconds(next_funding)}
             self.symbol = message["data"]["info"]["name"]  # required to be set for self.write_candles()
 
             if self.last_timestamp.get(self.symbol, 0) != time:
                 del message["data"]["stats"]["nextFundingTime"]  # don't want this as a tag
-                logger.trace(f"Writing: {arrow.get(time['time'])}:{message}")
+                logger.opt(lazy=True).trace("Writing: {}:{}", lambda: next_funding, lambda: message)
 
                 self.write_candles([time | message["data"]["info"] | message["data"]["stats"]], timestamp_units="s")
                 self.last_timestamp[self.symbol] = time
@@ -0,0 +1,87 @@
+from influxdb.resultset import ResultSet
+import pytest
+
+from candles.batch import CandleBatch
+
+BITFINEX_ORDER = {"ts": 0, "open": 1, "close": 2, "high": 3, "low": 4, "volume": 5}
+SFOX_KEYS = {
+    "ts": "start_time",
+    "open": "open_price",
+    "high": "high_price",
+    "low": "low_price",
+    "close": "close_price",
+    "volume": "volume",
+}
+
+
+class TestCandleBatch:
+    def test_from_list_rows(self):
+        rows = [[1590889920000, 1.0, 1.5, 2.0, 0.5, 10], [1590889980000, 1.5, 1.0, 1.6, 0.9, 11]]
+        batch = CandleBatch.from_rows(rows, BITFINEX_ORDER)
+        assert len(batch) == 2
+        assert list(batch.ts) == [1590889920000, 1590889980000]
+        assert batch.row(1) == (1590889980000, 1.5, 1.6, 0.9, 1.0, 11.0)
+        assert batch.invalid_rows() == []
+
+    def test_from_dict_rows_in_seconds(self):
+        rows = [
+            {
+                "open_price": "33894.8",
+                "high_price": "34024.84",
+                "low_price": "33876.14",
+                "close_price": "33968.91",
+                "volume": "16.87853538",
+                "start_time": 1611594060,
+            }
+        ]
+        batch = CandleBatch.from_rows(rows, SFOX_KEYS, timestamp_units="s")
+        assert list(batch.rows()) == [(1611594060000, 33894.8, 34024.84, 33876.14, 33968.91, 16.87853538)]
+
+    def test_empty(self):
+        batch = CandleBatch.from_rows([], BITFINEX_ORDER)
+        assert len(batch) == 0
+        batch.validate()
+
+    def test_validate(self):
+        rows = [
+            [1, 1.0, 1.5, 2.0, 0.5, 10],
+            [2, 1.0, 1.5, 0.4, 0.5, 10],  # high < low
+            [3, 3.0, 1.5, 2.0, 0.5, 10],  # open > high
+        ]
+        batch = CandleBatch.from_rows(rows, BITFINEX_ORDER)
+        assert sorted({i for i, _ in batch.invalid_rows()}) == [1, 2]
+        with pytest.raises(AssertionError, match="Low price must be <= the High price"):
+            batch.validate()
+
+    def test_drop(self):
+        rows = [[1, 1.0, 1.5, 2.0, 0.5, 10], [2, 1.0, 1.5, 0.4, 0.5, 10], [3, 1.0, 1.5, 2.0, 0.5, 10]]
+        batch = CandleBatch.from_rows(rows, BITFINEX_ORDER).drop([1])
+        assert list(batch.ts) == [1, 3]
+        assert batch.invalid_rows() == []
+
+    def test_from_influx(self):
+        columns = ["time", "open", "high", "low", "close", "volume"]
+        res = ResultSet(
+            {
+                "series": [
+                    {
+                        "name": "candles_1m",
+                        "columns": columns,
+                        "values": [[1590889920000, 1.0, 2.0, 0.5, 1.5, 10], [1590889980000, 1.5, 1.6, 0.9, 1.0, None]],
+                    }
+                ]
+            }
+        )
+        batch = CandleBatch.from_influx(res)
+        assert batch.row(0) == (1590889920000, 1.0, 2.0, 0.5, 1.5, 10.0)
+        assert batch.row(1)[:5] == (1590889980000, 1.5, 1.6, 0.9, 1.0)
+        assert batch.volume[1] != batch.volume[1]  # NaN
+        assert len(CandleBatch.from_influx(ResultSet({}))) == 0
+
+    def test_to_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        rows = [[1, 1.0, 1.5, 2.0, 0.5, 10], [2, 1.0, 1.5, 2.0, 0.5, 11]]
+        array = CandleBatch.from_rows(rows, BITFINEX_ORDER).to_numpy()
+        assert array["ts"].tolist() == [1, 2]
+        assert array["volume"].dtype == numpy.float64
+        assert array[1]["high"] == 2.0
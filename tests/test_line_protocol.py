@@ -0,0 +1,52 @@
+from influxdb.line_protocol import make_lines
+
+from candles.batch import CandleBatch
+from candles.line_protocol import encode_candles, encode_point
+
+
+class TestLineProtocol:
+    def test_candles_match_influxdb_python(self):
+        tags = {"symbol": "fUSD", "interval": "1m", "period": "p2"}
+        batch = CandleBatch([1590889920000], [0.0003102], [0.000397], [0.0003102], [0.000397], [25731.30573344])
+        expected = make_lines(
+            {
+                "points": [
+                    {
+                        "measurement": "candles_1m",
+                        "tags": tags,
+                        "time": 1590889920000,
+                        "fields": {
+                            "open": 0.0003102,
+                            "high": 0.000397,
+                            "low": 0.0003102,
+                            "close": 0.000397,
+                            "volume": 25731.30573344,
+                        },
+                    }
+                ]
+            },
+            precision="ms",
+        )
+        assert "\n".join(encode_candles("candles_1m", tags, batch)) + "\n" == expected
+
+    def test_candles_as_strings(self):
+        batch = CandleBatch([1611594060000], [33894.8], [34024.84], [33876.14], [33968.91], [16.87853538])
+        assert encode_candles("candles_1m", {"symbol": "btcusd"}, batch, string_fields=True) == [
+            'candles_1m,symbol=btcusd close="33968.91",high="34024.84",low="33876.14",open="33894.8",'
+            'volume="16.87853538" 1611594060000'
+        ]
+
+    def test_point_escaping(self):
+        line = encode_point(
+            "futures_1h",
+            {"symbol": "BTC-PERP", "description": "Bitcoin Perpetual, Futures", "expiry": ""},
+            {"volume": 121716.1139, "openInterest": 36659.7905, "mark": float("nan"), "name": 'say "hi"'},
+            1646762400000,
+        )
+        assert line == (
+            r"futures_1h,description=Bitcoin\ Perpetual\,\ Futures,symbol=BTC-PERP "
+            r'name="say \"hi\"",openInterest=36659.7905,volume=121716.1139 1646762400000'
+        )
+
+    def test_point_without_fields(self):
+        assert encode_point("futures_1h", {"symbol": "BTC-PERP"}, {"mark": None}, 1646762400000) is None
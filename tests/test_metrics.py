@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+from candles.metrics import SyncMetrics
+
+
+class TestSyncMetrics:
+    def test_counters_and_histograms(self):
+        metrics = SyncMetrics("binance", "BTCUSDT")
+        metrics.count("api_calls")
+        metrics.count("rows_written", 1000)
+        metrics.count("rows_written", 500)
+        for rows in (0, 1000, 1000, 20_000):
+            metrics.observe("rows_per_response", rows)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["counters"] == {"api_calls": 1, "rows_written": 1500}
+        rows = snapshot["histograms"]["rows_per_response"]
+        assert rows["count"] == 4
+        assert rows["buckets"]["0"] == 1
+        assert rows["buckets"]["1000"] == 3
+        assert rows["buckets"]["+Inf"] == 4
+
+        prom = metrics.to_prometheus()
+        assert 'market_data_rows_written_total{exchange="binance",symbol="BTCUSDT"} 1500' in prom
+        assert 'market_data_rows_per_response_bucket{exchange="binance",symbol="BTCUSDT",le="500"} 1' in prom
+        assert 'market_data_rows_per_response_count{exchange="binance",symbol="BTCUSDT"} 4' in prom
+
+    def test_export(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("CANDLES_METRICS_DIR", raising=False)
+        metrics = SyncMetrics("sfox", "btc/usd")
+        with metrics.timer("write_latency_seconds"):
+            pass
+        assert metrics.export() is None  # CANDLES_METRICS_DIR isn't set
+
+        fname = metrics.export(str(tmp_path), "json")
+        assert fname == str(tmp_path / "sfox_btc_usd.json")
+        with open(fname) as fh:
+            assert json.load(fh)["histograms"]["write_latency_seconds"]["count"] == 1
+        assert metrics.export(str(tmp_path)) == str(tmp_path / "sfox_btc_usd.prom")
+
+    def test_concurrent_exports(self, tmp_path):
+        """Funding periods share one SyncMetrics and export from their own threads"""
+        metrics = SyncMetrics("bitfinex", "fUSD")
+        metrics.count("api_calls")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            fnames = list(pool.map(lambda _: metrics.export(str(tmp_path)), range(200)))
+        assert set(fnames) == {str(tmp_path / "bitfinex_fUSD.prom")}
+        assert os.listdir(tmp_path) == ["bitfinex_fUSD.prom"]  # no temp files left behind
@@ -0,0 +1,82 @@
+from decimal import Decimal as D
+import re
+
+from requests_mock import ANY, mock
+
+from candles import query_cache
+from candles.candles import Candles
+from candles.line_protocol import encode_point
+from candles.query_cache import QueryCache
+
+SERIES = ("test_binance", "candles_1m", "BTCUSDT")
+
+
+class TestQueryCache:
+    def test_invalidates_overlapping_ranges(self):
+        cache = QueryCache(10, 60)
+        ranges = {"old": (1_000, 2_000), "recent": (5_000, 6_000), "since": (3_000, None), "all": (None, None)}
+        for name, (start, end) in ranges.items():
+            cache.put(SERIES + (name,), name, SERIES, start, end, cache.generation(SERIES))
+        other = ("test_binance", "candles_1m", "ETHUSDT")
+        cache.put(other + ("all",), "other", other, None, None, cache.generation(other))
+
+        cache.invalidate(SERIES, 5_500, 7_000)
+        assert cache.get(SERIES + ("old",)) == (True, "old")
+        assert cache.get(SERIES + ("recent",)) == (False, None)
+        assert cache.get(SERIES + ("since",)) == (False, None)
+        assert cache.get(SERIES + ("all",)) == (False, None)
+        assert cache.get(other + ("all",)) == (True, "other")
+
+    def test_lru_ttl_and_writes_during_queries(self):
+        cache = QueryCache(2, 60)
+        for name in ("a", "b"):
+            cache.put(SERIES + (name,), name, SERIES, None, None, cache.generation(SERIES))
+        cache.get(SERIES + ("a",))
+        cache.put(SERIES + ("c",), "c", SERIES, None, None, cache.generation(SERIES))
+        assert cache.get(SERIES + ("b",)) == (False, None)
+        assert cache.get(SERIES + ("a",)) == (True, "a")
+
+        generation = cache.generation(SERIES)
+        cache.invalidate(SERIES, 0, 1)  # a write lands while "d" is being queried
+        cache.put(SERIES + ("d",), "d", SERIES, None, None, generation)
+        assert cache.get(SERIES + ("d",)) == (False, None)
+
+        cache = QueryCache(2, 0)
+        cache.put(SERIES + ("a",), "a", SERIES, None, None, cache.generation(SERIES))
+        assert cache.get(SERIES + ("a",)) == (False, None)
+
+    def test_candles_write_during_query(self, monkeypatch):
+        """A write landing while a query runs keeps that query's result out of the cache, even if nothing was cached
+        for the series before
+        """
+        monkeypatch.setenv("CANDLES_QUERY_CACHE_SIZE", "10")
+        monkeypatch.setattr(query_cache, "_cache", None)
+        stored = {"low": 1.0, "high": 2.0}
+        writes = []
+
+        def query(request, context):
+            if "min(low)" not in request.qs["q"][0]:
+                return {"results": [{"statement_id": 0}]}
+            low, high = stored["low"], stored["high"]
+            if not writes:
+                influx.write_lines(
+                    [encode_point("candles_1m", {"symbol": "BTCUSDT"}, {"low": 0.5, "high": 3.0}, 60_000)]
+                )
+            series = {"name": "candles_1m", "columns": ["time", "low", "high"], "values": [[0, low, high]]}
+            return {"results": [{"statement_id": 0, "series": [series]}]}
+
+        def write(request, context):
+            writes.append(request.body)
+            stored.update(low=0.5, high=3.0)
+            context.status_code = 204
+            return ""
+
+        with mock() as m:
+            m.register_uri(ANY, re.compile(r"localhost:8086/query"), json=query)
+            m.register_uri("POST", re.compile(r"localhost:8086/write"), text=write)
+            influx = Candles("binance", "BTCUSDT", "1m")
+            assert influx.get_lowhigh(start=0, end=120) == (1, 2)  # read before the write landed
+            assert len(writes) == 1
+            assert influx.get_lowhigh(start=0, end=120) == (D("0.5"), 3)
+            assert influx.get_lowhigh(start=0, end=120) == (D("0.5"), 3)  # cached now
+            assert len([r for r in m.request_history if "min(low)" in r.qs.get("q", [""])[0]]) == 2
@@ -0,0 +1,84 @@
+import asyncio
+import fcntl
+import threading
+import time
+
+from candles.rate_limit import TokenBucket, get_rate_limiter
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(limit=20, period=1, burst=10)
+        start = time.time()
+        for _ in range(10):
+            assert bucket.acquire() == 0  # the burst is available straight away
+        waited = bucket.acquire(weight=5)
+        assert waited > 0
+        # 5 tokens at (20 - 10) / 1s refill
+        assert 0.4 < time.time() - start < 1.0
+
+    def test_never_exceeds_limit_in_a_period(self):
+        bucket = TokenBucket(limit=40, period=1, burst=10)
+        stamps = []
+        lock = threading.Lock()
+
+        def _worker():
+            for _ in range(15):
+                bucket.acquire()
+                with lock:
+                    stamps.append(time.time())
+
+        threads = [threading.Thread(target=_worker) for _ in range(4)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        stamps.sort()
+        for i, stamp in enumerate(stamps):
+            assert len([x for x in stamps[i:] if x - stamp < 1]) <= 40
+
+    def test_weights_and_penalize(self):
+        bucket = TokenBucket(limit=100, period=1, burst=10)
+        assert bucket.acquire(weight=10) == 0
+        bucket.penalize(0.3)
+        assert bucket.acquire(weight=1) >= 0.25
+
+    def test_shared_between_processes(self, tmp_path):
+        state_file = str(tmp_path / "binance.json")
+        one = TokenBucket(limit=20, period=1, burst=5, state_file=state_file)
+        two = TokenBucket(limit=20, period=1, burst=5, state_file=state_file)
+        assert one.acquire(weight=5) == 0
+        assert two.acquire(weight=5) > 0  # the budget was already spent by the other bucket
+
+    def test_async_with_locked_state_file(self, tmp_path):
+        """Waiting on another process' file lock doesn't stall the event loop"""
+        state_file = str(tmp_path / "binance.json")
+        bucket = TokenBucket(limit=20, period=1, burst=5, state_file=state_file)
+        ticks = []
+
+        async def _ticker():
+            while True:
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        async def _run():
+            ticker = asyncio.ensure_future(_ticker())
+            waited = await bucket.acquire_async()
+            ticker.cancel()
+            return waited
+
+        with open(state_file, "a+") as other:  # another process, mid-update
+            fcntl.flock(other, fcntl.LOCK_EX)
+            threading.Timer(0.2, fcntl.flock, (other, fcntl.LOCK_UN)).start()
+            assert asyncio.run(_run()) == 0
+        assert len(ticks) > 5
+
+    def test_low_limits(self):
+        for limit in (1, 2, 39):
+            bucket = TokenBucket(limit=limit, period=60)
+            assert bucket.burst >= 1 and bucket.rate > 0
+            assert bucket.acquire() == 0
+        assert TokenBucket(limit=10, period=1, burst=50).burst == 9
+
+    def test_shared_per_exchange(self):
+        assert get_rate_limiter("binance", 1200) is get_rate_limiter("binance", 1200)
+        assert get_rate_limiter("binance", 1200) is not get_rate_limiter("bitfinex", 90)
+        assert get_rate_limiter("tardis", None) is None
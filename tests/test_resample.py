@@ -0,0 +1,40 @@
+from influxdb.resultset import ResultSet
+
+from candles.resample import Resampler, interval_to_seconds
+
+
+class FakeCandles:
+    """Returns one canned GROUP BY time(), * result, and keeps the queries and lines written"""
+
+    def __init__(self, values):
+        self.values = values
+        self.queries = []
+        self.lines = []
+
+    def query(self, query, bind_params=None):
+        self.queries.append((query, bind_params))
+        columns = ["time", "open", "high", "low", "close", "volume"]
+        tags = {"interval": "1m", "period": "p2", "symbol": "fUSD"}
+        return ResultSet({"series": [{"name": "candles_1m", "tags": tags, "columns": columns, "values": self.values}]})
+
+    def write_lines(self, lines):
+        self.lines += lines
+
+
+class TestResampler:
+    def test_interval_to_seconds(self):
+        assert interval_to_seconds("5m") == 300
+        assert interval_to_seconds("4h") == 14_400
+        assert interval_to_seconds("1d") == 86_400
+
+    def test_resample(self):
+        influx = FakeCandles([[1590883200000, 1.0, 2.5, 0.5, 2.0, 30.0], [1590897600000, 2.0, 3.0, 1.5, 2.5, 12.0]])
+        resampler = Resampler("bitfinex", "fUSD", influx_client=influx)
+        assert resampler.resample("4h", 1590889920, 1590898000) == 2
+
+        query, params = influx.queries[0]
+        assert "GROUP BY time(4h), * fill(none)" in query
+        assert (params["start"], params["end"]) == (1590883200 * 10**9, 1590912000 * 10**9)  # whole 4h buckets
+        assert influx.lines[0] == (
+            "candles_4h,interval=4h,period=p2,symbol=fUSD close=2.0,high=2.5,low=0.5,open=1.0,volume=30.0 1590883200000"
+        )
@@ -0,0 +1,30 @@
+import os
+
+from candles.response_cache import ResponseCache
+
+
+class TestResponseCache:
+    def test_get_put(self, tmp_path):
+        cache = ResponseCache(str(tmp_path), 1_000_000)
+        key = cache.key("bitfinex", "candles/trade:1m:tBTCUSD/hist", {"start": 1590889920000, "limit": 10_000})
+        assert key == cache.key("bitfinex", "candles/trade:1m:tBTCUSD/hist", {"limit": 10_000, "start": 1590889920000})
+        assert cache.get(key) is None
+
+        response = [[1590889920000, 9500.0, 9510.5, 9520.0, 9490.0, 12.5]]
+        cache.put(key, response)
+        assert cache.get(key) == response
+        assert ResponseCache(str(tmp_path), 1_000_000).get(key) == response  # survives restarts
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResponseCache(str(tmp_path), 2_000)
+        response = [[i, str(i) * 20] for i in range(100)]  # ~600 bytes gzipped
+        keys = [cache.key("binance", "klines", {"startTime": i}) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            cache.put(key, response)
+            os.utime(cache._file(key), (i, i))
+        cache.get(keys[0])  # recently used again, so keys[1] is the oldest now
+
+        cache.put(keys[3], response)
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) == response
+        assert cache.get(keys[3]) == response
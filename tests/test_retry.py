@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+import requests
+
+from candles.retry import Retry, error_status, retry_after
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def flaky(errors, result="ok"):
+    """Returns a function raising each of errors in turn, then returning result"""
+    errors = list(errors)
+    calls = []
+
+    def _func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    _func.calls = calls
+    return _func
+
+
+class TestRetry:
+    def test_error_classification(self):
+        err = http_error(429, {"Retry-After": "3"})
+        assert error_status(err) == 429
+        assert retry_after(err) == 3
+        assert retry_after(http_error(503)) is None
+        assert error_status(requests.exceptions.ConnectionError()) is None
+
+    def test_retries_with_retry_after(self, monkeypatch):
+        sleeps, backoffs = [], []
+        monkeypatch.setattr("candles.retry.time.sleep", sleeps.append)
+        retry = Retry(
+            lambda err: error_status(err) in (429, 503),
+            on_backoff=lambda err, delay: backoffs.append((error_status(err), delay)),
+        )
+        func = flaky([http_error(429, {"Retry-After": "7"}), http_error(503)])
+        assert retry.call(func) == "ok"
+        assert len(func.calls) == 3
+        assert sleeps[0] == 7
+        assert 0 <= sleeps[1] <= 2  # jittered exponential backoff, second attempt
+        assert [status for status, _ in backoffs] == [429, 503]
+
+    def test_gives_up(self, monkeypatch):
+        monkeypatch.setattr("candles.retry.time.sleep", lambda _: None)
+        retry = Retry(lambda err: error_status(err) == 503, max_attempts=3)
+
+        func = flaky([http_error(400)])
+        with pytest.raises(requests.exceptions.HTTPError):
+            retry.call(func)
+        assert len(func.calls) == 1  # not retryable
+
+        func = flaky([http_error(503)] * 5)
+        with pytest.raises(requests.exceptions.HTTPError):
+            retry.call(func)
+        assert len(func.calls) == 3
+
+    def test_call_async(self):
+        retry = Retry(lambda err: True, base_delay=0.01)
+        func = flaky([ConnectionError(), ConnectionError()])
+
+        async def _coro():
+            return func()
+
+        assert asyncio.run(retry.call_async(_coro)) == "ok"
+        assert len(func.calls) == 3
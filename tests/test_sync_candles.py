@@ -1,12 +1,98 @@
+from decimal import Decimal as D
+import asyncio
+import json
+import random
 import re
+import threading
+import time
 
+from aiohttp import web
 from freezegun import freeze_time
+from influxdb.exceptions import InfluxDBServerError
 from loguru import logger
+from pytest import mark
 from requests_mock import ANY, mock
 import arrow
 
 from candles.candles import Candles
-from candles.sync_candles import get_sync_candles_class
+from candles.resample import Resampler
+from candles.stream import CandleStream
+from candles.sync_candles import (
+    BaseSyncCandles,
+    SyncBinanceCandles,
+    SyncBitfinexCandles,
+    epoch_seconds,
+    get_sync_candles_class,
+    merge_ranges,
+    pull_all_async,
+    subtract_ranges,
+)
+
+START = 1590889920  # s, a whole minute
+
+
+class StubExchange(object):
+    """Stands in for a candle endpoint, as a sync class's api_request(). Returns a candle (all prices `price`) every
+    `every` seconds in the requested [start, end], oldest first and up to the limit, like Binance and Bitfinex do.
+    Requests are recorded as (start, end) in s. fail_at is a request start (s) to raise on, and max_delay adds a random
+    delay (s) to each request.
+    """
+
+    def __init__(self, every=60, fail_at=None, max_delay=0, price=1.0):
+        self.every = every
+        self.price = price
+        self.fail_at = fail_at
+        self.max_delay = max_delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, endpoint, params):
+        start = params.get("startTime", params.get("start")) // 1_000
+        end = params.get("endTime", params.get("end")) // 1_000
+        with self._lock:
+            self.requests.append((start, end))
+        if self.max_delay:
+            time.sleep(random.uniform(0, self.max_delay))
+        if start == self.fail_at:
+            raise ValueError(f"stub failure at {start}")
+        first = start + -start % self.every
+        candles = [[ts * 1_000] + [self.price] * 5 for ts in range(first, end + 1, self.every)]
+        return candles[: params["limit"]]
+
+    def sync_client(self, cls, symbol, start, end, **attrs):
+        """An instance of cls requesting candles from this stub, with attrs overriding its class attributes"""
+        stub = self
+        attrs["api_request"] = lambda client, endpoint, params: stub(endpoint, params)
+        return type(f"Stub{cls.__name__}", (cls,), attrs)(symbol, "1m", start=start, end=end)
+
+
+def mock_influx(m, write_status=204):
+    """Answers influx queries like an empty db, and accepts writes"""
+    m.register_uri(ANY, re.compile(r"localhost:8086/query"), json={"results": [{"statement_id": 0}]})
+    m.register_uri("POST", re.compile(r"localhost:8086/write"), status_code=write_status)
+
+
+def written(m):
+    """Timestamps (s) of the candles written to influx, in write order"""
+    lines = [line for r in m.request_history if r.path == "/write" for line in r.body.decode().splitlines()]
+    return [int(line.rsplit(" ", 1)[1]) // 1_000 for line in lines]
+
+
+def run_with_timeout(func, timeout=30):
+    """Runs func on a thread and returns what it raised (or None), failing if it's still running after timeout"""
+    errors = []
+
+    def _run():
+        try:
+            func()
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "deadlocked"
+    return errors[0] if errors else None
 
 
 class TestSyncSFOXCandles:
@@ -122,6 +208,168 @@ class TestSyncBitfinexCandles:
             assert arrow.get(float(last_exchange_req.qs["end"][0]) / 1000).int_timestamp == end
 
 
+class TestAsyncSyncCandles:
+    def test_pull_candles_async(self):
+        """Same as the Bitfinex sync, through the asyncio engine against a local stand-in for the exchange"""
+        exchange = "bitfinex"
+        symbol = "fUSD"
+        interval = "1m"
+        start = 1590889920.0
+        end = 1590891120.0
+
+        influx = Candles(exchange, symbol, interval, create_if_missing=True)
+        influx.client.query("DROP SERIES FROM /.*/")
+        funding_candles = open("tests/data/candles_fUSD.json", "r").read()
+        requests = []
+
+        async def _candles(request):
+            requests.append(request)
+            return web.Response(text=funding_candles, content_type="application/json")
+
+        async def _run():
+            app = web.Application()
+            app.router.add_get("/v2/{endpoint:.*}", _candles)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                client = get_sync_candles_class(
+                    exchange=exchange, symbol=symbol, interval=interval, start=start, end=end
+                )
+                client.API_BASE_URL = f"http://127.0.0.1:{port}/v2/"
+                await pull_all_async([client])
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(_run())
+        assert len(requests) == 29  # one per funding period
+        assert {int(r.query["start"]) // 1_000 for r in requests} == {start}
+        assert {int(r.query["end"]) // 1_000 for r in requests} == {end}
+        assert len(influx.get("*")) == 290
+
+
+class TestCandleStream:
+    def test_stream(self):
+        """Streams from a local stand-in for Binance's kline websocket, which drops the first connection"""
+        exchange = "binance"
+        symbol = "ETHUSDT"
+        interval = "1m"
+        start = 1590889920
+
+        influx = Candles(exchange, symbol, interval, create_if_missing=True)
+        influx.client.query("DROP SERIES FROM /.*/")
+        connections = []
+        rest_requests = []
+
+        def _kline(ts, closed):
+            return {
+                "e": "kline",
+                "s": symbol,
+                "k": {"t": ts * 1_000, "o": "1.5", "h": "2", "l": "1", "c": "1.8", "v": "10", "x": closed},
+            }
+
+        async def _ws(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            connections.append(request)
+            if len(connections) == 1:
+                await ws.send_json(_kline(start, False))  # still open, not written
+                await ws.send_json(_kline(start, True))
+                await ws.send_json(_kline(start + 60, True))
+                await ws.close()  # drop, so the client reconnects and backfills
+            else:
+                await ws.send_json(_kline(start + 120, True))
+                async for _ in ws:
+                    pass
+            return ws
+
+        async def _klines(request):
+            rest_requests.append(request)
+            return web.json_response([])
+
+        async def _run():
+            app = web.Application()
+            app.router.add_get("/ws/{stream}", _ws)
+            app.router.add_get("/api/v3/klines", _klines)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                client = get_sync_candles_class(exchange=exchange, symbol=symbol, interval=interval)
+                client.API_BASE_URL = f"http://127.0.0.1:{port}/api/v3/"
+                stream = CandleStream(client, url=f"http://127.0.0.1:{port}/ws/ethusdt@kline_1m")
+                stream.FLUSH_SECONDS = 0.05
+                stream.RECONNECT_DELAY = 0.01
+                task = asyncio.ensure_future(stream.run())
+                for _ in range(200):
+                    await asyncio.sleep(0.05)
+                    if len(connections) == 2 and len(influx.get("*") or []) == 3:
+                        break
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(_run())
+        assert len(connections) == 2
+        assert {r.query["symbol"] for r in rest_requests} == {symbol}  # backfilled over REST
+        assert [c["time"] // 1_000 for c in influx.get("*")] == [start, start + 60, start + 120]
+
+    def test_failed_flush(self):
+        """Candles that failed to write stay pending, and a write error reconnects rather than ending the stream"""
+        statuses = [500, 204]
+
+        def write(request, context):
+            context.status_code = statuses.pop(0)
+            return ""
+
+        with mock() as m:
+            mock_influx(m)
+            m.register_uri("POST", re.compile(r"localhost:8086/write"), text=write)
+            client = get_sync_candles_class("binance", "BTCUSDT", "1m")
+            stream = CandleStream(client, url="http://127.0.0.1:1/ws")
+            stream._delay = 0  # reconnect straight away
+            stream.pending = [[START * 1_000, 1.0, 1.0, 1.0, 1.0, 1.0]]
+            connects = []
+
+            async def _consume():
+                connects.append(len(stream.pending))
+                if len(connects) == 3:
+                    raise asyncio.CancelledError
+                await stream.flush()
+
+            stream._consume = _consume
+            try:
+                asyncio.run(stream.run())
+            except asyncio.CancelledError:
+                pass
+        assert connects == [1, 1, 0]  # kept after the 500, written after reconnecting
+        assert written(m) == [START, START]
+
+
+class TestTimestamps:
+    def test_epoch_seconds(self):
+        for value in [
+            1590889920,
+            1590889920.5,
+            1590889920123,
+            1590889920123456,
+            "2020-05-31T01:52:00+00:00",
+            "2020-05-31T01:52:00Z",
+            "2020-05-31T01:52:00",
+            "2020-05-31T03:52:00+02:00",
+        ]:
+            assert epoch_seconds(value) == arrow.get(value).int_timestamp == 1590889920
+
+    def test_timestamp_ranges(self):
+        steps = list(BaseSyncCandles.timestamp_ranges(1590889920, 1590891120, 3))
+        assert steps == [1590889920, 1590890320, 1590890720, 1590891120]
+
+
 class TestCandles:
     def test_get(self):
         exchange = "bitfinex"
@@ -224,3 +472,387 @@ class TestCandles:
         end = 1590891120.0
         low, high = influx.get_lowhigh(start=start, end=end)
         assert low > 0.0 and high > 0.0
+
+    def test_get_lowhigh_windows(self):
+        influx = Candles("bitfinex", "fUSD", "1m")
+        windows = influx.get_lowhigh_windows("5m", start=1590889920, end=1590891120)
+        assert windows and all(low <= high for _, low, high in windows)
+        assert windows == sorted(windows)
+
+    def test_get_lowhigh_ranges(self):
+        ranges = [(1590889920, 1590890520), (1590890520, 1590891120), (1590800000, 1590800060)]
+        lowhigh = [[1590889920000, 9490.0, 9520.0], [1590890520000, 9480.5, 9515.0]]
+        results = [
+            {"statement_id": i, "series": [{"name": "candles_1m", "columns": ["time", "low", "high"], "values": [row]}]}
+            for i, row in enumerate(lowhigh)
+        ]
+        results.append({"statement_id": 2})  # no candles in that range
+        with mock() as m:
+            m.register_uri("GET", re.compile(r"localhost:8086"), json={"results": [{"statement_id": 0}]})
+            m.register_uri("POST", re.compile(r"localhost:8086"), json={"results": results})
+            influx = Candles("binance", "BTCUSDT", "1m")
+            calls = m.call_count
+            assert influx.get_lowhigh_ranges(ranges) == [(9490, 9520), (D("9480.5"), 9515), (None, None)]
+            assert m.call_count == calls + 1
+            assert m.last_request.qs["q"][0].count(";") == 2
+
+    def test_iter_range(self):
+        queried = []
+
+        def respond(request, context):
+            if "params" not in request.qs:
+                return {"results": [{"statement_id": 0}]}
+            params = json.loads(request.qs["params"][0])
+            queried.append((params["start"], params["end"]))
+            values = [
+                [ts // 1_000_000, 1.0, 2.0, 0.5, 1.5, 10.0] for ts in range(params["start"], params["end"], 60 * 10**9)
+            ]
+            columns = ["time", "open", "high", "low", "close", "volume"]
+            return {
+                "results": [
+                    {"statement_id": 0, "series": [{"name": "candles_1m", "columns": columns, "values": values}]}
+                ]
+            }
+
+        start = 1590889920
+        with mock() as m:
+            m.register_uri(ANY, re.compile(r"localhost:8086"), json=respond)
+            influx = Candles("binance", "BTCUSDT", "1m")
+            candles = list(influx.iter_range(start, start + 25 * 60, chunk=600))
+            assert [c["time"] for c in candles] == [(start + i * 60) * 1_000 for i in range(25)]
+            assert len(queried) == 3 and queried[-1][1] == (start + 25 * 60) * 10**9
+
+            batches = list(influx.iter_range(start, start + 25 * 60, chunk=600, batches=True))
+            assert [len(batch) for batch in batches] == [10, 10, 5]
+
+    def test_many_symbols(self):
+        series = [
+            {"name": "candles_1m", "tags": {"symbol": symbol}, "columns": ["time", "low", "high"], "values": [row]}
+            for symbol, row in (("BTCUSDT", [0, 9490.0, 9520.0]), ("ETH/USD", [0, 230.5, 240.0]))
+        ]
+        with mock() as m:
+            m.register_uri(ANY, re.compile(r"localhost:8086"), json={"results": [{"statement_id": 0}]})
+            influx = Candles("binance", "BTCUSDT", "1m")
+            m.register_uri(ANY, re.compile(r"localhost:8086"), json={"results": [{"series": series}]})
+            calls = m.call_count
+            res = influx.get_lowhigh_many(["BTCUSDT", "ETH/USD", "XRPUSDT"], start=1590889920, end=1590891120)
+            assert res == {"BTCUSDT": (9490, 9520), "ETH/USD": (D("230.5"), 240), "XRPUSDT": (None, None)}
+            assert m.call_count == calls + 1
+            assert "=~ /^(BTCUSDT|ETH\\/USD|XRPUSDT)$/" in m.last_request.qs["q"][0].upper()
+
+
+class TestSyncPipeline:
+    """Concurrent window fetches (API_CONCURRENCY) feeding the influx writer thread (WRITE_QUEUE_SIZE)"""
+
+    WINDOW = 600  # s, 10 candles
+    END = START + 30 * WINDOW
+
+    def sync_client(self, stub):
+        return stub.sync_client(SyncBinanceCandles, "BTCUSDT", START, self.END, API_MAX_RECORDS=10, API_CONCURRENCY=4)
+
+    def test_ordered_writes(self):
+        stub = StubExchange(max_delay=0.01)  # so responses come back out of order
+        with mock() as m:
+            mock_influx(m)
+            assert run_with_timeout(self.sync_client(stub).pull_data) is None
+        assert sorted(stub.requests) == [(start, start + self.WINDOW) for start in range(START, self.END, self.WINDOW)]
+        assert written(m) == list(range(START, self.END, 60))
+
+    def test_fetch_error(self):
+        """A failing window stops the sync. Every window before it is written, nothing after it."""
+        fail_at = START + 7 * self.WINDOW
+        stub = StubExchange(fail_at=fail_at, max_delay=0.01)
+        with mock() as m:
+            mock_influx(m)
+            err = run_with_timeout(self.sync_client(stub).pull_data)
+        assert isinstance(err, ValueError)
+        assert written(m) == list(range(START, fail_at, 60))
+
+    def test_write_error(self):
+        """A failing influx write stops the sync too, without leaving the fetching side blocked on a full queue"""
+        stub = StubExchange(max_delay=0.01)
+        writes = []
+
+        def write(request, context):
+            writes.append(request)
+            if len(writes) < 3:
+                context.status_code = 204
+                return ""
+            time.sleep(0.2)  # long enough for the fetching side to fill up the queue
+            context.status_code = 500
+            return '{"error": "timeout"}'
+
+        with mock() as m:
+            mock_influx(m)
+            m.register_uri("POST", re.compile(r"localhost:8086/write"), text=write)
+            err = run_with_timeout(self.sync_client(stub).pull_data)
+        assert isinstance(err, InfluxDBServerError)
+        assert len(stub.requests) < 30  # stopped fetching
+
+
+class TestSyncCheckpoints:
+    WINDOW = 600  # s, 10 candles
+    END = START + 30 * WINDOW
+
+    def test_resume(self, tmp_path, monkeypatch):
+        """A sync failing at window k leaves a checkpoint, and the next sync resumes at window k's start"""
+        monkeypatch.setenv("CANDLES_SYNC_STATE_DB", str(tmp_path / "sync_state.db"))
+        fail_at = START + 7 * self.WINDOW
+        windows = [(start, start + self.WINDOW) for start in range(START, self.END, self.WINDOW)]
+        attrs = dict(API_MAX_RECORDS=10, API_CONCURRENCY=4)
+
+        failing = StubExchange(fail_at=fail_at, max_delay=0.01)
+        with mock() as m:
+            mock_influx(m)
+            client = failing.sync_client(SyncBinanceCandles, "BTCUSDT", START, self.END, **attrs)
+            assert isinstance(run_with_timeout(client.pull_data), ValueError)
+        first_run = written(m)
+        assert client.sync_state.get_checkpoint(client._series_key()) == [[fail_at, self.END]]
+
+        stub = StubExchange(max_delay=0.01)
+        with mock() as m:
+            mock_influx(m)
+            client = stub.sync_client(SyncBinanceCandles, "BTCUSDT", START, self.END, **attrs)
+            assert run_with_timeout(client.pull_data) is None
+        second_run = written(m)
+
+        k = windows.index((fail_at, fail_at + self.WINDOW))
+        # concurrent, so in any order. Then the usual latest->end top up
+        assert sorted(stub.requests[: len(windows) - k]) == windows[k:]
+        assert first_run == list(range(START, fail_at, 60))
+        assert second_run[0] == fail_at
+        assert sorted(set(first_run + second_run)) == list(range(START, self.END + 1, 60))
+        assert client.sync_state.get_checkpoint(client._series_key()) is None
+
+
+class TestCursorPagination:
+    def test_cursor_pages(self):
+        """Each page starts CURSOR_OVERLAP candles before the last one returned, and a short page ends the sync"""
+        stub = StubExchange(every=120)  # sparse: a candle every other minute
+        end = START + 3_030
+        with mock() as m:
+            mock_influx(m)
+            client = stub.sync_client(SyncBitfinexCandles, "tBTCUSD", START, end, API_MAX_RECORDS=10)
+            assert run_with_timeout(client.pull_data) is None
+        # last candles START+1080 and START+2160, less a minute. The third page only has 7 candles.
+        assert stub.requests == [(START, end), (START + 1_020, end), (START + 2_100, end)]
+        assert written(m) == list(range(START, end, 120))  # the overlap candles once
+
+    def test_cursor_progress(self):
+        """The cursor always moves forward, even when CURSOR_OVERLAP reaches back before the page's start"""
+        with mock() as m:
+            mock_influx(m)
+            client = StubExchange().sync_client(
+                SyncBitfinexCandles, "tBTCUSD", START, START + 3_000, API_MAX_RECORDS=10, CURSOR_OVERLAP=20
+            )
+        page = client.to_candle_batch([[ts * 1_000, 1.0, 1.0, 1.0, 1.0, 1.0] for ts in range(START, START + 600, 60)])
+        assert client._next_cursor(START, page) == START + 1
+        assert client._next_cursor(START, page.drop([9])) is None  # short page
+
+
+class TestFundingCoverage:
+    def test_query_funding_coverage(self):
+        """Earliest/latest of every funding period from one query, including periods missing from a statement"""
+
+        def _series(columns, rows):
+            return [
+                {"name": "candles_1m", "tags": {"period": period}, "columns": ["time"] + columns, "values": [row]}
+                for period, row in rows.items()
+            ]
+
+        first = {"p2": [START * 1_000, 1.0], "p3": [(START + 60) * 1_000, 1.0]}
+        last = {
+            "p2": [(START + 600) * 1_000, 1.0, 2.0, 0.5, 1.5, 10.0],
+            "p4": [(START + 120) * 1_000, 1.0, 2.0, 0.5, 1.5, 10.0],
+        }
+        results = [
+            {"statement_id": 0, "series": _series(["first"], first)},
+            {"statement_id": 1, "series": _series(["last", "high", "low", "close", "volume"], last)},
+        ]
+        with mock() as m:
+            mock_influx(m)
+            client = get_sync_candles_class("bitfinex", "fUSD", "1m")
+            m.register_uri(ANY, re.compile(r"localhost:8086/query"), json={"results": results})
+            coverage = client._query_funding_coverage()
+        assert m.last_request.qs["q"][0].count(";") == 1  # one round trip
+        assert coverage == {
+            "p2": ((START, START + 600), {(START + 600) * 1_000: (1, 2, D("0.5"), D("1.5"), 10)}),
+            "p3": ((START + 60, START + 60), {}),
+            "p4": ((START + 120, START + 120), {(START + 120) * 1_000: (1, 2, D("0.5"), D("1.5"), 10)}),
+        }
+
+
+class TestResampleWritten:
+    def test_merge_ranges(self):
+        assert merge_ranges([(300, 400), (0, 60), (120, 180), (60, 100)], gap=60) == [(0, 180), (300, 400)]
+        assert merge_ranges([(0, 60), (120, 180)]) == [(0, 60), (120, 180)]
+
+    def test_resample_written_ranges(self, monkeypatch):
+        """Only the buckets around what was written are resampled, not everything between a repaired gap and the
+        latest candles
+        """
+        resampled = []
+        monkeypatch.setattr(
+            Resampler, "resample", lambda self, interval, start, end: resampled.append((interval, start, end))
+        )
+
+        def _candles(start, end):
+            return [[ts * 1_000, 1.0, 1.0, 1.0, 1.0, 1.0] for ts in range(start, end + 1, 60)]
+
+        with mock() as m:
+            mock_influx(m)
+            client = StubExchange().sync_client(SyncBinanceCandles, "BTCUSDT", START, START + 86_400)
+            client.RESAMPLE_INTERVALS = ("5m", "1d")
+            client.write_candles(_candles(START + 86_400 - 600, START + 86_400 - 300))  # latest candles
+            client.write_candles(_candles(START, START + 120))  # a repaired gap
+            client.write_candles(_candles(START + 180, START + 240))  # and the window after it
+            client.write_candles(_candles(START + 86_400 - 240, START + 86_400))
+        assert client._written_ranges == [(START, START + 240), (START + 86_400 - 600, START + 86_400)]
+
+        client.resample_written()
+        assert resampled == [
+            ("5m", START, START + 240),
+            ("5m", START + 86_400 - 600, START + 86_400),
+            ("1d", START, START + 86_400),  # a day apart at most, so one range
+        ]
+
+
+class TestSkipUnchanged:
+    def test_latest_candles_in_sync_state(self, tmp_path, monkeypatch):
+        """Incremental syncs drop the boundary candle they restart from when it hasn't changed, and rewrite it when it
+        has (it was still open), knowing which from the sync state store rather than influx
+        """
+        monkeypatch.setenv("CANDLES_SYNC_STATE_DB", str(tmp_path / "sync_state.db"))
+        attrs = dict(API_MAX_RECORDS=10)
+
+        def _sync(stub, end):
+            with mock() as m:
+                mock_influx(m)
+                client = stub.sync_client(SyncBinanceCandles, "BTCUSDT", START, end, **attrs)
+                assert run_with_timeout(client.pull_data) is None
+            queries = [r.qs["q"][0] for r in m.request_history if "q" in r.qs]
+            return written(m), queries
+
+        first_run, _ = _sync(StubExchange(), START + 1_200)
+        assert first_run == list(range(START, START + 1_200, 60))  # up to the limit of the last window
+
+        unchanged, queries = _sync(StubExchange(), START + 1_800)
+        assert unchanged == list(range(START + 1_200, START + 1_801, 60))  # not the latest candle, START + 1_140
+        assert not [q for q in queries if "desc limit 1" in q]  # neither the watermarks nor the latest candle
+
+        changed, _ = _sync(StubExchange(price=2.0), START + 2_400)
+        assert changed[0] == START + 1_800
+
+
+class TestGapRepair:
+    DAY = 1590883200  # START's day
+    BUCKETS = list(range(DAY, DAY + 4 * 86_400, 86_400))
+
+    @staticmethod
+    def mock_counts(m, counts):
+        """Answers the gap scan with counts per 1d bucket, and anything else like an empty db"""
+
+        def query(request, context):
+            if "count(open)" not in request.qs["q"][0]:
+                return {"results": [{"statement_id": 0}]}
+            values = [[ts * 1_000, count] for ts, count in counts.items()]
+            series = {"name": "candles_1m", "columns": ["time", "count"], "values": values}
+            return {"results": [{"statement_id": 0, "series": [series]}]}
+
+        m.register_uri(ANY, re.compile(r"localhost:8086/query"), json=query)
+
+    def test_gap_ranges(self):
+        day1, day2, day3 = self.BUCKETS[1:]
+        end = day3 + 3_600  # a partial last bucket
+        with mock() as m:
+            mock_influx(m)
+            client = get_sync_candles_class("binance", "BTCUSDT", "1m")
+            # START is 112 minutes into its day, so the first bucket has 1_328 candle slots, and the last one 60
+            self.mock_counts(m, {self.DAY: 1_328, day1: 1_000, day2: 1_439, day3: 60})
+            assert client.get_gap_ranges(START, end) == [(day1, day3)]  # adjacent incomplete days merged
+            assert "group by time(1d)" in m.last_request.qs["q"][0]
+
+            self.mock_counts(m, {self.DAY: 1_327, day1: 1_440, day2: 1_440, day3: 59})
+            assert client.get_gap_ranges(START, end) == [(START, day1), (day3, end)]
+            # from half a minute in, the first candle slot is START + 60
+            self.mock_counts(m, {self.DAY: 1_327, day1: 1_440, day2: 1_440, day3: 60})
+            assert client.get_gap_ranges(START + 30, end) == []
+
+    def test_subtract_ranges(self):
+        assert subtract_ranges([(0, 100), (200, 300)], [(50, 60), (20, 30), (250, 400)]) == [
+            (0, 20),
+            (30, 50),
+            (60, 100),
+            (200, 250),
+        ]
+        assert subtract_ranges([(0, 100)], []) == [(0, 100)]
+
+    def test_repaired_gaps_not_refetched(self, tmp_path, monkeypatch):
+        """A day still incomplete after it was refetched (the exchange doesn't have those candles either) isn't
+        refetched by the next sync
+        """
+        monkeypatch.setenv("CANDLES_SYNC_STATE_DB", str(tmp_path / "sync_state.db"))
+        day1, day2 = self.BUCKETS[1:3]
+        requests = []
+        for _ in range(2):
+            stub = StubExchange()
+            with mock() as m:
+                mock_influx(m)
+                client = stub.sync_client(
+                    SyncBinanceCandles, "BTCUSDT", self.DAY, day2, API_MAX_RECORDS=1_000, REPAIR_GAPS=True
+                )
+                client.sync_state.set_watermarks(client._series_key(), self.DAY, day2 - 60)
+                self.mock_counts(m, {self.DAY: 1_440, day1: 1_000})
+                assert run_with_timeout(client.pull_data) is None
+            requests.append(stub.requests)
+        assert requests[0][:2] == [(day1, day1 + 43_200), (day1 + 43_200, day2)]
+        assert [start for start, _ in requests[1]] == [day2 - 60]  # only latest->end
+        assert client.sync_state.get_repaired_gaps(client._series_key()) == [(day1, day2)]
+
+
+class TestResponseCache:
+    WINDOW = 600  # s, the 10 candles of API_MAX_RECORDS
+
+    @mark.parametrize("cls,symbol", [(SyncBinanceCandles, "BTCUSDT"), (SyncBitfinexCandles, "tBTCUSD")])
+    def test_same_history_twice(self, cls, symbol, tmp_path, monkeypatch):
+        """Syncs of the same history request the same grid windows whatever their end, so the second one is served
+        from the response cache entirely
+        """
+        monkeypatch.setenv("CANDLES_RESPONSE_CACHE_DIR", str(tmp_path))
+        ends = [START + 20 * self.WINDOW + 300, START + 20 * self.WINDOW + 100]  # in the same window
+        stubs, runs = [], []
+        for end in ends:
+            stub = StubExchange()
+            with mock() as m:
+                mock_influx(m)  # an empty db, so both sync everything from START
+                client = stub.sync_client(cls, symbol, START, end, API_MAX_RECORDS=10, API_CONCURRENCY=4)
+                assert run_with_timeout(client.pull_data) is None
+            stubs.append(stub)
+            runs.append(written(m))
+
+        grid = START - START % self.WINDOW
+        assert START > grid  # START isn't on the grid, so the first window is widened to it
+        assert sorted(set(stubs[0].requests)) == [
+            (start, start + self.WINDOW) for start in range(grid, ends[0], self.WINDOW)
+        ]
+        assert stubs[1].requests == []
+        assert runs[0] == list(range(START, ends[0] + 1, 60))  # only start->end, though whole windows were fetched
+        assert runs[1] == list(range(START, ends[1] + 1, 60))
+
+
+class TestSFOXFields:
+    def test_string_fields(self):
+        """SFOX candles are written as strings, as they always were, and compared to the stored ones as floats"""
+        rows = json.load(open("tests/data/candles_sfox_btcusd.json"))[:3]
+        latest = {k: rows[0][f"{k}_price"] for k in ("open", "high", "low", "close")}
+        latest.update(volume=rows[0]["volume"], time=rows[0]["start_time"] * 1_000)
+        series = {"name": "candles_1m", "columns": list(latest), "values": [list(latest.values())]}
+        with mock() as m:
+            mock_influx(m)
+            client = get_sync_candles_class("sfox", "btcusd", "1m")
+            m.register_uri(ANY, re.compile(r"localhost:8086/query"), json={"results": [{"series": [series]}]})
+            client.write_candles(rows, timestamp_units="s")
+        lines = [line for r in m.request_history if r.path == "/write" for line in r.body.decode().splitlines()]
+        assert len(lines) == 2  # the first one is stored already
+        assert f'open="{rows[1]["open_price"]}"' in lines[0]
+        assert f'volume="{rows[1]["volume"]}"' in lines[0]
@@ -0,0 +1,78 @@
+from candles.sync_state import SyncStateStore
+
+KEY = ("bitfinex", "1m", "candles", "period=p2,symbol=fUSD")
+
+
+class TestSyncStateStore:
+    def test_watermarks(self, tmp_path):
+        store = SyncStateStore(str(tmp_path / "state.sqlite"))
+        assert store.get_watermarks(KEY) is None
+
+        # writes to series we haven't seen in influx yet don't create an entry
+        store.extend_watermarks(KEY, 1590889920, 1590891120)
+        assert store.get_watermarks(KEY) is None
+
+        store.set_watermarks(KEY, 0, 0)  # influx says it's empty
+        assert store.get_watermarks(KEY) == (0, 0)
+        store.extend_watermarks(KEY, 1590889920, 1590891120)
+        assert store.get_watermarks(KEY) == (1590889920, 1590891120)
+        store.extend_watermarks(KEY, 1590889000, 1590890000)
+        assert store.get_watermarks(KEY) == (1590889000, 1590891120)
+
+        # shared with other processes through the file
+        assert SyncStateStore(str(tmp_path / "state.sqlite")).get_watermarks(KEY) == (1590889000, 1590891120)
+
+    def test_mark_suspect(self, tmp_path):
+        store = SyncStateStore(str(tmp_path / "state.sqlite"))
+        other = ("bitfinex", "1m", "candles", "symbol=tBTCUSD")
+        store.set_watermarks(KEY, 1590889920, 1590891120)
+        store.set_watermarks(other, 1590889920, 1590891120)
+
+        store.mark_suspect("bitfinex", "fUSD")
+        assert store.get_watermarks(KEY) is None
+        assert store.get_watermarks(other) == (1590889920, 1590891120)
+
+        store.set_watermarks(KEY, 1590889920, 1590891120)  # refreshed from influx
+        assert store.get_watermarks(KEY) == (1590889920, 1590891120)
+
+    def test_checkpoints(self, tmp_path):
+        store = SyncStateStore(str(tmp_path / "state.sqlite"))
+        assert store.get_checkpoint(KEY) is None
+
+        store.set_checkpoint(KEY, [[1590889920, 1590891120], [1590895000, None]])
+        assert SyncStateStore(str(tmp_path / "state.sqlite")).get_checkpoint(KEY) == [
+            [1590889920, 1590891120],
+            [1590895000, None],
+        ]
+
+        store.set_checkpoint(KEY, [])  # all done
+        assert store.get_checkpoint(KEY) is None
+
+    def test_latest_candles(self, tmp_path):
+        store = SyncStateStore(str(tmp_path / "state.sqlite"))
+        candles = {1590891060000: (1.0, 2.0, 0.5, 1.5, 10.0), 1590891120000: (1.5, 2.5, 1.0, 2.0, 5.0)}
+        store.set_latest_candles(KEY, candles)
+        assert store.get_latest_candles(KEY) is None  # no watermarks to go with them
+
+        store.set_watermarks(KEY, 0, 0)
+        assert store.get_latest_candles(KEY) == {}  # known empty
+        store.set_latest_candles(KEY, candles)
+        store.extend_watermarks(KEY, 1590889920, 1590891120)
+        assert SyncStateStore(str(tmp_path / "state.sqlite")).get_latest_candles(KEY) == candles
+
+        store.mark_suspect("bitfinex")
+        assert store.get_latest_candles(KEY) is None
+        store.set_watermarks(KEY, 1590889920, 1590891180)  # refreshed from influx, which may have newer candles
+        assert store.get_latest_candles(KEY) is None
+
+    def test_repaired_gaps(self, tmp_path):
+        store = SyncStateStore(str(tmp_path / "state.sqlite"))
+        other = ("bitfinex", "1m", "candles", "symbol=tBTCUSD")
+        store.add_repaired_gap(KEY, 1590969600, 1591056000)
+        store.add_repaired_gap(KEY, 1590883200, 1590969600)
+        store.add_repaired_gap(other, 1590883200, 1590969600)
+        assert store.get_repaired_gaps(KEY) == [(1590883200, 1590969600), (1590969600, 1591056000)]
+
+        store.mark_suspect("bitfinex", "fUSD")  # candles deleted, so scan again
+        assert store.get_repaired_gaps(KEY) == []
+        assert store.get_repaired_gaps(other) == [(1590883200, 1590969600)]